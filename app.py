@@ -1,14 +1,37 @@
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import plotly.express as px
 import plotly.graph_objects as go
+import copy
+import hashlib
+import json
+import os
 import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO, StringIO
 from datetime import datetime
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import streamlit as st
+from lxml import etree
+from pandas.io.parsers import TextParser
+
+# Copy-on-Write: column selections and sheet slices share memory with their source until
+# written to, so frames shared across sessions and reruns never need defensive copies.
+# pandas 3 always behaves this way and deprecates the option.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 PLOTLY_DARK_THEME = {
     "paper_bgcolor": "rgba(0,0,0,0)",
     "plot_bgcolor": "rgba(0,0,0,0)",
@@ -53,9 +76,27 @@ DISTRICT_URLS = {
     "DEORIA": "https://jjm.up.gov.in/SKADA/Web_SKADA_DIstrict_Agency_Dashboard?DistrictId=516&AgencyId=127&Header=Automation%20System%20Deoria%20(UNIVERSAL%20MEP)",
 }
 
+# On-disk cache for district dashboard pages (see fetch_url).
+# Pages younger than HTTP_CACHE_MAX_AGE seconds are served without contacting the portal;
+# older ones are revalidated with If-None-Match / If-Modified-Since.
+HTTP_CACHE_DIR = Path(os.environ.get("JJM_HTTP_CACHE_DIR", Path(tempfile.gettempdir()) / "jjm_swsm_http_cache"))
+HTTP_CACHE_MAX_AGE = int(os.environ.get("JJM_HTTP_CACHE_MAX_AGE", "300"))
 
-from openpyxl import load_workbook
-from openpyxl.styles import Alignment, Font, Border, Side, PatternFill
+# Upper bound on simultaneous portal requests when loading all districts.
+DISTRICT_FETCH_WORKERS = int(os.environ.get("JJM_DISTRICT_FETCH_WORKERS", "8"))
+
+# Portal HTTP session: (connect, read) timeouts in seconds and retry budget for
+# connection errors, read timeouts and 5xx answers (exponential backoff).
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("JJM_HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.environ.get("JJM_HTTP_READ_TIMEOUT", "60"))
+HTTP_RETRIES = int(os.environ.get("JJM_HTTP_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR = float(os.environ.get("JJM_HTTP_BACKOFF_FACTOR", "0.5"))
+
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import Alignment, Font, Border, Side, PatternFill, NamedStyle
 from openpyxl.utils import get_column_letter
 
 # ===========================
@@ -1052,38 +1093,430 @@ def apply_dark_mode_weather_effect():
 # ---------------------------
 # Reading the uploaded file
 # ---------------------------
+# Normalized header fragments that identify the scheme table on dashboard pages / HTML exports
+SCHEME_TABLE_FINGERPRINTS = ("schemeid", "lastdatareceivedate")
+
+
+def _cell_text(cell) -> str:
+    text = cell.text if len(cell) == 0 else "".join(cell.itertext())
+    return " ".join(text.split()) if text else ""
+
+
+def _table_rows(table) -> tuple[list, list]:
+    """Split a <table> element into (header rows, body rows) the same way pd.read_html does."""
+    thead = table.xpath("./thead/tr")
+    body = table.xpath("./tbody/tr | ./tr")
+    tfoot = table.xpath("./tfoot/tr")
+
+    if thead:
+        header = thead
+    else:
+        header = []
+        while body and all(c.tag == "th" for c in body[0].iterchildren("td", "th")):
+            header.append(body.pop(0))
+
+    return header, body + tfoot
+
+
+def _expand_spans(rows: list) -> list[list[str]]:
+    """Cell texts per row with colspan/rowspan repeated into every covered slot."""
+    if not any(c.get("colspan") or c.get("rowspan") for tr in rows for c in tr.iterchildren("td", "th")):
+        return [[_cell_text(c) for c in tr.iterchildren("td", "th")] for tr in rows]
+
+    out = []
+    pending = []  # (col index, text, rows left) carried down by rowspan
+
+    for tr in rows:
+        texts = []
+        carried = []
+        col = 0
+        cells = tr.iterchildren("td", "th")
+
+        while True:
+            if pending and pending[0][0] == col:
+                _, text, left = pending.pop(0)
+                texts.append(text)
+                if left > 1:
+                    carried.append((col, text, left - 1))
+                col += 1
+                continue
+
+            cell = next(cells, None)
+            if cell is None:
+                break
+
+            text = _cell_text(cell)
+            colspan = int(cell.get("colspan", 1) or 1)
+            rowspan = int(cell.get("rowspan", 1) or 1)
+            for _ in range(max(colspan, 1)):
+                texts.append(text)
+                if rowspan > 1:
+                    carried.append((col, text, rowspan - 1))
+                col += 1
+
+        for c, text, left in pending:
+            texts.append(text)
+            if left > 1:
+                carried.append((c, text, left - 1))
+
+        pending = sorted(carried)
+        out.append(texts)
+
+    return out
+
+
+def extract_scheme_table(raw: bytes, encoding: str = "utf-8"):
+    """
+    Stream the HTML with lxml and parse only the scheme table.
+
+    Tables are inspected as soon as they close; the first one whose header carries all
+    SCHEME_TABLE_FINGERPRINTS is converted (numbers inferred like pd.read_html) and the
+    rest of the document is never parsed. Returns None when no table matches.
+    """
+    context = etree.iterparse(
+        BytesIO(raw),
+        events=("end",),
+        tag="table",
+        html=True,
+        encoding=encoding,
+        recover=True,
+    )
+
+    for _, table in context:
+        header_rows, body_rows = _table_rows(table)
+        header_text = re.sub(r"\s+", "", " ".join(_cell_text(tr) for tr in header_rows)).lower()
+
+        if header_rows and body_rows and all(f in header_text for f in SCHEME_TABLE_FINGERPRINTS):
+            header = _expand_spans(header_rows)
+            body = _expand_spans(body_rows)
+            del context
+
+            width = max(len(r) for r in header + body)
+            rows = [r + [""] * (width - len(r)) for r in header + body]
+            df = TextParser(
+                rows,
+                header=list(range(len(header))) if len(header) > 1 else 0,
+                thousands=",",
+            ).read()
+            return flatten_columns(df)
+
+        # Nested tables are re-visited through their parent; drop what we no longer need.
+        table.clear()
+
+    return None
+
+
+# .xlsx reader: "openpyxl" (default) or "calamine" (Rust-backed, needs python-calamine and pandas>=2.2).
+# calamine only materializes the columns the report uses.
+XLSX_READER = os.environ.get("JJM_XLSX_READER", "openpyxl").strip().lower()
+
+# Dtype backend of parsed sources: "numpy" (default) or "pyarrow". Arrow-backed text makes the
+# clean-up in build_scheme_frame run in Arrow compute; pyarrow ships with Streamlit.
+DTYPE_BACKEND = os.environ.get("JJM_DTYPE_BACKEND", "numpy").strip().lower()
+
+# Debug switch: keep every source column after ingest instead of only the ones the report reads
+KEEP_FULL_SOURCE = os.environ.get("JJM_KEEP_FULL_SOURCE", "").strip().lower() in ("1", "true", "yes")
+
+# Parsed uploads shared by all sessions, keyed by a hash of the file bytes
+UPLOAD_CACHE_MAX_BYTES = int(os.environ.get("JJM_UPLOAD_CACHE_MAX_MB", "256")) * 1024 * 1024
+UPLOAD_CACHE_TTL = int(os.environ.get("JJM_UPLOAD_CACHE_TTL", "3600"))
+
+# Leading bytes of the container formats we accept
+XLSX_MAGIC = b"PK\x03\x04"                          # ZIP (xlsx / xlsm)
+XLS_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"   # OLE2 compound file (BIFF .xls)
+
+
+def sniff_source_format(raw: bytes) -> tuple[str, str | None]:
+    """
+    Detect the upload format from its first bytes.
+    Returns (format, text encoding) with format one of "xlsx", "xls", "html".
+    """
+    if raw.startswith(XLSX_MAGIC):
+        return "xlsx", None
+    if raw.startswith(XLS_MAGIC):
+        return "xls", None
+
+    if raw.startswith((b"\xff\xfe", b"\xfe\xff")):
+        encoding = "utf-16"
+        head = raw[:4096].decode(encoding, errors="ignore").lstrip()
+    else:
+        encoding = "utf-8"
+        head = raw[:4096].decode(encoding, errors="ignore").lstrip("\ufeff \t\r\n")
+
+    head_lower = head.lower()
+    if "urn:schemas-microsoft-com:office:spreadsheet" in head_lower and "<html" not in head_lower:
+        raise ValueError(
+            "Uploaded file is an Excel 2003 XML spreadsheet, which is not supported. "
+            "Open it in Excel and save it as .xlsx."
+        )
+    if head.startswith("<"):
+        return "html", encoding
+
+    if not raw:
+        raise ValueError("Uploaded file is empty.")
+    raise ValueError(
+        "Unsupported file format: expected .xlsx/.xlsm (ZIP), legacy .xls (OLE2) or an HTML table export, "
+        f"but the file starts with {raw[:8]!r}."
+    )
+
+
+def backend_kwargs(dtype_backend: str = DTYPE_BACKEND) -> dict:
+    """Reader keyword arguments for JJM_DTYPE_BACKEND."""
+    if dtype_backend == "numpy":
+        return {}
+    if dtype_backend == "pyarrow":
+        return {"dtype_backend": "pyarrow"}
+    raise ValueError(f"Unknown JJM_DTYPE_BACKEND {dtype_backend!r}: use 'numpy' or 'pyarrow'.")
+
+
+def apply_dtype_backend(df: pd.DataFrame, dtype_backend: str = DTYPE_BACKEND) -> pd.DataFrame:
+    """Convert what a reader left numpy-backed (the HTML table parser has no dtype_backend)."""
+    kwargs = backend_kwargs(dtype_backend)
+    return df.convert_dtypes(**kwargs) if kwargs else df
+
+
+def read_xlsx(raw: bytes, reader: str = XLSX_READER, dtype_backend: str = DTYPE_BACKEND) -> pd.DataFrame:
+    kwargs = backend_kwargs(dtype_backend)
+    if reader == "openpyxl":
+        return pd.read_excel(BytesIO(raw), engine="openpyxl", **kwargs)
+    if reader != "calamine":
+        raise ValueError(f"Unknown JJM_XLSX_READER {reader!r}: use 'openpyxl' or 'calamine'.")
+
+    # Header row only: openpyxl's read-only mode stops after the first row.
+    usecols = None
+    if not KEEP_FULL_SOURCE:
+        header = pd.read_excel(BytesIO(raw), engine="openpyxl", nrows=0).columns
+        usecols = report_column_positions(header)
+    return pd.read_excel(BytesIO(raw), engine="calamine", usecols=usecols, **kwargs)
+
+
+class ByteBudgetCache:
+    """
+    Thread-safe LRU cache bounded by the total size of its values.
+    Entries expire `ttl` seconds after they were stored; values must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (stored_at, nbytes, value)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def put(self, key, value, nbytes: int) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if nbytes > self.max_bytes:
+                return
+            while self._entries and self._total + nbytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+            self._entries[key] = (time.time(), nbytes, value)
+            self._total += nbytes
+
+    def _drop(self, key) -> None:
+        _, nbytes, _ = self._entries.pop(key)
+        self._total -= nbytes
+
+
+@st.cache_resource(show_spinner=False)
+def get_upload_cache() -> ByteBudgetCache:
+    return ByteBudgetCache(UPLOAD_CACHE_MAX_BYTES, UPLOAD_CACHE_TTL)
+
+
 def read_source(uploaded_file) -> pd.DataFrame:
     """
-    Robust reader:
-    1) Try Excel via openpyxl (works for .xlsx/.xlsm)
-    2) If fails, try HTML-table fallback (common for some .xls exports that are HTML)
+    Parse an upload once per distinct file content: identical bytes uploaded in any
+    session (or re-read on a rerun) come back from the shared upload cache.
     """
     raw = uploaded_file.getvalue()
+    key = f"{hashlib.sha256(raw).hexdigest()}:{XLSX_READER}:{KEEP_FULL_SOURCE}:{DTYPE_BACKEND}"
+
+    cache = get_upload_cache()
+    df = cache.get(key)
+    if df is None:
+        df = parse_source(raw)
+        cache.put(key, df, int(df.memory_usage(deep=True).sum()))
+    return df
+
+
+def parse_source(raw: bytes) -> pd.DataFrame:
+    """
+    Robust reader, routed by the file's leading bytes:
+    1) ZIP  -> Excel via openpyxl or calamine (.xlsx/.xlsm, see XLSX_READER)
+    2) OLE2 -> legacy Excel via xlrd (.xls)
+    3) HTML -> scheme-table extraction (common for .xls exports that are really HTML)
+    """
+    fmt, encoding = sniff_source_format(raw)
+
+    if fmt == "xlsx":
+        df = read_xlsx(raw)
+    elif fmt == "xls":
+        df = pd.read_excel(BytesIO(raw), engine="xlrd", **backend_kwargs())
+    else:
+        df = extract_scheme_table(raw, encoding=encoding)
+
+    if df is None:
+        html = raw.decode(encoding, errors="ignore")
+        tables = pd.read_html(StringIO(html), **backend_kwargs())
+        if not tables:
+            raise ValueError("Could not parse any tables from the uploaded file.")
+        df = max(tables, key=lambda t: t.shape[0])
+
+    return apply_dtype_backend(project_report_columns(df))
+
 
+@st.cache_resource(show_spinner=False)
+def get_http_session() -> requests.Session:
+    """
+    One keep-alive session shared by every Streamlit session and rerun.
+    Retries connect/read failures and 500/502/503/504 with exponential backoff.
+    """
+    retry = Retry(
+        total=HTTP_RETRIES,
+        connect=HTTP_RETRIES,
+        read=HTTP_RETRIES,
+        status=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=max(1, len(DISTRICT_URLS)),
+        pool_maxsize=max(1, DISTRICT_FETCH_WORKERS),
+        max_retries=retry,
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "User-Agent": "Mozilla/5.0",
+        "Accept-Encoding": "gzip, deflate",
+    })
+    return session
+
+
+def _http_cache_paths(url: str) -> tuple[Path, Path]:
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return HTTP_CACHE_DIR / f"{key}.body", HTTP_CACHE_DIR / f"{key}.json"
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    # A unique temp file per write: sessions and district workers share one process.
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp", delete=False) as tmp:
+        tmp.write(data)
     try:
-        return pd.read_excel(BytesIO(raw), engine="openpyxl")
-    except Exception:
+        os.replace(tmp.name, path)
+    except OSError:
+        os.unlink(tmp.name)
+        raise
+
+
+def _read_http_cache(body_path: Path, meta_path: Path) -> tuple[dict | None, bytes | None]:
+    """
+    (meta, body) of a cached page, or (None, None) when either file is missing or unreadable,
+    or the body is not the one the meta describes (two writers interleaved).
+    """
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        body = body_path.read_bytes()
+    except (OSError, ValueError):
+        return None, None
+    if meta.get("sha256") != hashlib.sha256(body).hexdigest():
+        return None, None
+    return meta, body
+
+
+def fetch_url(url: str, max_age: int = HTTP_CACHE_MAX_AGE) -> tuple[bytes, str]:
+    """
+    Download a portal page through the on-disk HTTP cache.
+    Returns (body bytes, text encoding).
+
+    - cached copy younger than max_age seconds: returned without any request
+    - older copy: conditional GET; a 304 reuses the stored body
+    - max_age=0 always revalidates
+    """
+    body_path, meta_path = _http_cache_paths(url)
+    meta, cached = _read_http_cache(body_path, meta_path)
+
+    if meta is not None and time.time() - meta.get("fetched_at", 0) < max_age:
+        return cached, meta.get("encoding") or "utf-8"
+
+    headers = {}
+    if meta is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    session = get_http_session()
+    timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    resp = session.get(url, headers=headers, timeout=timeout)
+
+    if resp.status_code == 304 and cached is not None:
+        body = cached
+    else:
+        if resp.status_code == 304:
+            # Nothing cached to reuse: ask again without validators.
+            resp = session.get(url, timeout=timeout)
+        resp.raise_for_status()
+        body = resp.content
+        meta = {
+            "url": url,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "encoding": resp.encoding or resp.apparent_encoding,
+            "sha256": hashlib.sha256(body).hexdigest(),
+        }
+
+    meta["fetched_at"] = time.time()
+    try:
+        HTTP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _write_atomic(body_path, body)
+        _write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+    except OSError:
+        # A read-only or full disk only costs us the cache, never the page.
         pass
 
-    html = raw.decode("utf-8", errors="ignore")
-    tables = pd.read_html(StringIO(html))
-    if not tables:
-        raise ValueError("Could not parse any tables from the uploaded file.")
-    df = max(tables, key=lambda t: t.shape[0])
-    return df
-def read_source_from_url(url: str) -> pd.DataFrame:
+    return body, meta.get("encoding") or "utf-8"
+
+
+def read_source_from_url(url: str, max_age: int = HTTP_CACHE_MAX_AGE) -> pd.DataFrame:
     """
     Read district dashboard table directly from JJM URL.
+    An unchanged page (same bytes, e.g. after a 304) reuses the frame parsed last time.
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0"
-    }
+    body, encoding = fetch_url(url, max_age=max_age)
+    key = f"{hashlib.sha256(body).hexdigest()}:{encoding}:{KEEP_FULL_SOURCE}"
+
+    cache = get_upload_cache()
+    df = cache.get(key)
+    if df is None:
+        df = parse_dashboard(body, encoding)
+        cache.put(key, df, int(df.memory_usage(deep=True).sum()))
+    return df
+
 
-    resp = requests.get(url, headers=headers, timeout=60)
-    resp.raise_for_status()
+def parse_dashboard(body: bytes, encoding: str) -> pd.DataFrame:
+    df = extract_scheme_table(body, encoding=encoding)
+    if df is not None:
+        return apply_dtype_backend(project_report_columns(df))
 
-    html = resp.text
-    tables = pd.read_html(StringIO(html))
+    html = body.decode(encoding, errors="replace")
+    tables = pd.read_html(StringIO(html), **backend_kwargs())
 
     if not tables:
         raise ValueError("Could not parse any tables from the district URL.")
@@ -1095,9 +1528,33 @@ def read_source_from_url(url: str) -> pd.DataFrame:
     else:
         df = max(tables, key=lambda t: t.shape[0] * t.shape[1])
 
-    df = flatten_columns(df)
-    return df
-    
+    return apply_dtype_backend(project_report_columns(df))
+
+
+def read_all_districts(
+    urls: dict = DISTRICT_URLS,
+    max_workers: int = DISTRICT_FETCH_WORKERS,
+) -> tuple[dict, dict]:
+    """
+    Fetch and parse every district dashboard concurrently.
+    Returns (frames, errors): {district: DataFrame} for the ones that loaded and
+    {district: exception} for the ones that did not, both in `urls` order.
+    """
+    frames, errors = {}, {}
+    if not urls:
+        return frames, errors
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls)))) as pool:
+        futures = {name: pool.submit(read_source_from_url, url) for name, url in urls.items()}
+
+    for name, fut in futures.items():
+        exc = fut.exception()
+        if exc is None:
+            frames[name] = fut.result()
+        else:
+            errors[name] = exc
+
+    return frames, errors
 
 
 def flatten_columns(df: pd.DataFrame) -> pd.DataFrame:
@@ -1109,462 +1566,983 @@ def flatten_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def normalize_columns(df: pd.DataFrame) -> dict:
-    return {c: re.sub(r"\s+", "", str(c)).strip().lower() for c in df.columns}
+def normalize_label(column) -> str:
+    return re.sub(r"\s+", "", str(column)).strip().lower()
 
 
-def find_col_contains(norm_map: dict, *needles: str) -> str:
-    for c, cn in norm_map.items():
-        if all(n in cn for n in needles):
-            return c
-    raise KeyError(f"Missing column with fragments: {needles}")
+# ---------------------------
+# Column resolution
+# ---------------------------
+# Logical field -> normalized header fragments; the first source column containing all fragments wins.
+SCHEME_FIELD_FRAGMENTS = {
+    "scheme_id": ("schemeid",),
+    "scheme_name": ("schemename",),
+    "daily_demand": ("waterdemand", "meter3", "daily"),
+    "yest_supply": ("oht", "watersupply", "meter3", "yesterday"),
+    "today_prod": ("today", "waterproduction", "meter3"),
+    "last_data_date": ("lastdatareceivedate",),
+    "pump_status": ("pumpstatus",),
+    "hydro": ("groundwaterdepth", "avg", "meter"),
+    "chlorine": ("chlorine", "ppm"),
+    "pressure": ("pressure", "bar"),
+    "turbidity": ("turbidity", "ntu"),
+    "voltage": ("voltagern",),
+    "overall_prod": ("overallproductionwater", "meter3"),
+    "radar": ("ohtlevel", "valueinm"),
+    "lpcd_yesterday": ("lpcd", "yesterday"),
+    "lpcd_weekly": ("lpcd", "weekly"),
+    "lpcd_monthly": ("lpcd", "monthly"),
+}
+
+# LPCD STATUS columns R, S, T of the portal export
+LPCD_FIELDS = ["lpcd_yesterday", "lpcd_weekly", "lpcd_monthly"]
+LPCD_COLUMN_POSITIONS = [17, 18, 19]
+
+
+@dataclass(frozen=True)
+class ColumnMap:
+    """
+    Logical field -> source column position for one header layout.
+    `sno` is always the first column; `lpcd_positional` marks LPCD columns taken from R,S,T
+    because the header text did not identify them.
+    """
+
+    header: tuple
+    positions: dict
+    missing: tuple = ()
+    lpcd_positional: bool = False
+
+    def require(self) -> "ColumnMap":
+        """Raise the error a builder would hit on the first unresolved field."""
+        for field in self.missing:
+            if field not in LPCD_FIELDS:
+                raise KeyError(f"Missing column with fragments: {SCHEME_FIELD_FRAGMENTS[field]}")
+        if self.missing:
+            raise ValueError(
+                f"Source file has only {len(self.header)} columns. Need at least 20 columns to extract A,B,C,R,S,T."
+            )
+        return self
+
+    def column(self, field: str):
+        return self.header[self.positions[field]]
+
+    def report_positions(self) -> list | None:
+        """
+        Positions of the source columns the report uses (first column included), in source order.
+        None when some field can only be located positionally, i.e. the full width must be kept.
+        """
+        if self.missing or self.lpcd_positional:
+            return None
+        return sorted(set(self.positions.values()))
+
+
+def header_fingerprint(columns) -> str:
+    return hashlib.sha1("\x1f".join(str(c) for c in columns).encode("utf-8")).hexdigest()
+
+
+def _resolve_header(header: tuple) -> ColumnMap:
+    norm = [normalize_label(c) for c in header]
+
+    positions = {"sno": 0} if header else {}
+    pending = dict(SCHEME_FIELD_FRAGMENTS)
+    for i, cn in enumerate(norm):
+        for field, frags in list(pending.items()):
+            if all(f in cn for f in frags):
+                positions[field] = i
+                del pending[field]
+        if not pending:
+            break
+
+    # Full exports keep R,S,T; these win over header matches, and are the fallback when text fails.
+    lpcd_positional = False
+    if len(header) >= 20:
+        rst = dict(zip(LPCD_FIELDS, LPCD_COLUMN_POSITIONS))
+        if all("lpcd" in norm[i] for i in rst.values()):
+            positions.update(rst)
+        elif any(field in pending for field in LPCD_FIELDS):
+            positions.update(rst)
+            lpcd_positional = True
+        for field in LPCD_FIELDS:
+            pending.pop(field, None)
+
+    return ColumnMap(
+        header=header,
+        positions=positions,
+        missing=tuple(f for f in SCHEME_FIELD_FRAGMENTS if f in pending),
+        lpcd_positional=lpcd_positional,
+    )
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _cached_column_map(fingerprint: str, _header: tuple) -> ColumnMap:
+    return _resolve_header(_header)
+
+
+def resolve_columns(columns) -> ColumnMap:
+    """
+    One pass over the header maps every logical field to its source column.
+    Memoized by header fingerprint, so repeat files of the same layout skip resolution.
+    """
+    header = tuple(columns)
+    return _cached_column_map(header_fingerprint(header), header)
+
+
+def report_column_positions(columns) -> list | None:
+    return resolve_columns(columns).report_positions()
+
+
+def project_report_columns(df: pd.DataFrame, keep_all: bool = KEEP_FULL_SOURCE) -> pd.DataFrame:
+    """
+    Ingest step: flatten headers and drop every source column the report never reads,
+    so session state and all downstream builders only carry the ~20 used columns.
+    """
+    df = flatten_columns(df)
+    if keep_all:
+        return df
+
+    positions = report_column_positions(df.columns)
+    if positions is None or len(positions) == df.shape[1]:
+        return df
+    return df.iloc[:, positions]
 
 
 # ---------------------------
-# Business logic
+# Typed scheme frame
 # ---------------------------
-def build_report(df: pd.DataFrame, threshold: float = 75.0):
+SCHEME_NUMERIC_FIELDS = [
+    "daily_demand",
+    "yest_supply",
+    "today_prod",
+    "hydro",
+    "chlorine",
+    "pressure",
+    "turbidity",
+    "voltage",
+    "overall_prod",
+    "radar",
+    "lpcd_yesterday",
+    "lpcd_weekly",
+    "lpcd_monthly",
+]
+
+SCHEME_FRAME_COLUMNS = [
+    "sno",
+    "scheme_id",
+    "scheme_name",
+    *SCHEME_NUMERIC_FIELDS,
+    "pump_status",
+    "last_data_date",
+    "valid_scheme",
+    "site_key",
+]
+
+# Index name of every result frame: the dense scheme key of each row (see scheme_site_keys).
+SITE_KEY = "site_key"
+
+
+def _site_key_codes(scheme_id: pd.Series, scheme_name: pd.Series) -> np.ndarray:
     """
-    Returns: less_df, zero_df, today_zero_df
+    One integer per row for the "Scheme Id | Scheme Name" site key (stripped text, as the
+    dashboard compares them); -1 where either part is blank. Text work runs on the categories only.
+    """
+    def codes(cat: pd.Series):
+        labels, uniques = pd.factorize(_stripped_categories(cat))
+        raw = cat.cat.codes.to_numpy()
+        return np.where(raw >= 0, labels[raw], -1).astype(np.int64), len(uniques)
+
+    id_codes, _ = codes(scheme_id.astype("category"))
+    name_codes, n_names = codes(scheme_name.astype("category"))
+    return np.where((id_codes >= 0) & (name_codes >= 0), id_codes * (n_names + 1) + name_codes, -1)
+
+
+def _stripped_categories(cat: pd.Series) -> pd.Index:
+    return cat.cat.categories.astype(str).str.strip()
+
+
+def _named_rows(cat: pd.Series) -> np.ndarray:
+    """Rows holding a value that is neither blank nor "none" once stripped, decided per category."""
+    text = _stripped_categories(cat)
+    named = np.append(np.asarray((text != "") & (text.str.lower() != "none"), dtype=bool), False)
+    return named[cat.cat.codes.to_numpy()]
+
 
-    - less_df: supplied water < threshold (based on Yesterday / Demand)
-    - zero_df: ZERO(INACTIVE SITES) = Yesterday==0 AND Today==0 (excluding both blank)
-    - today_zero_df: TODAY ZERO SITES = Today==0 OR blank/NaN (regardless of yesterday)
+def scheme_site_keys(scheme_id: pd.Series, scheme_name: pd.Series) -> np.ndarray:
+    """
+    Canonical scheme registry: a dense int64 code 0..k-1 per Scheme Id | Scheme Name site,
+    numbered in order of first appearance; -1 where either part is blank.
+    """
+    raw = _site_key_codes(scheme_id, scheme_name)
+    keyed = raw >= 0
+    keys = np.full(len(raw), -1, dtype=np.int64)
+    keys[keyed] = pd.factorize(raw[keyed])[0]
+    return keys
+
+
+def _parse_receive_dates(values: pd.Series) -> pd.Series:
+    """Datetime column when every non-blank value parses (day first, as the portal writes it), else unchanged."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+
+    parsed = pd.to_datetime(values, dayfirst=True, errors="coerce")
+    if parsed.notna().sum() == values.notna().sum():
+        return parsed
+    return values
+
+
+def _stripped_text(values: pd.Series) -> pd.Series:
+    """Values as stripped text: Arrow strings (blank for missing) when the source is Arrow-backed, else str."""
+    if isinstance(values.dtype, pd.ArrowDtype) or getattr(values.dtype, "storage", None) == "pyarrow":
+        return values.astype("string[pyarrow]").fillna("").str.strip()
+    return values.astype(str).str.strip()
+
+
+def build_scheme_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normalization stage shared by every builder: one row per source row (RangeIndex, so labels are row positions),
+    logical column names, KPIs coerced to float once, scheme keys and pump status as
+    categoricals, Last Data Receive Date parsed, the valid-scheme mask precomputed, and
+    every row's site key from the scheme registry.
+
+    KPIs stay float64: the abnormal bounds (e.g. pressure <= 1.95, chlorine >= 0.15) are
+    inclusive and the values are exported as-is, both of which float32 would distort. They are
+    numpy float64 with NaN for blanks under either dtype backend; the text clean-up follows the
+    source's backend.
     """
     df = flatten_columns(df)
-    norm = normalize_columns(df)
+    cmap = resolve_columns(df.columns).require()
+    col = {field: df.iloc[:, i] for field, i in cmap.positions.items()}
 
-    scheme_id_col = find_col_contains(norm, "schemeid")
-    scheme_name_col = find_col_contains(norm, "schemename")
-    daily_demand_col = find_col_contains(norm, "waterdemand", "meter3", "daily")
+    # Scheme text is cleaned per category, never per row
+    scheme_id = col["scheme_id"].astype("category")
+    scheme_name = col["scheme_name"].astype("category")
 
-    yest_prod_col = None
-    for c, cn in norm.items():
-        if ("oht" in cn) and ("watersupply" in cn) and ("meter3" in cn) and ("yesterday" in cn):
-            yest_prod_col = c
-            break
-    if yest_prod_col is None:
-        raise KeyError("Could not find 'OHT Water Supply (Meter3) Yesterday' column.")
-
-    today_prod_col = find_col_contains(norm, "today", "waterproduction", "meter3")
-    last_date_col = find_col_contains(norm, "lastdatareceivedate")
-
-    work_df = df[[scheme_id_col, scheme_name_col, daily_demand_col, yest_prod_col, today_prod_col]].copy()
-    work_df.columns = [
-        "Scheme Id",
-        "Scheme Name",
-        "Daily Water Demand (m^3)",
-        "Yesterday Water Production (m^3)",
-        "Today Water Production (m^3)",
-    ]
+    out = {
+        "sno": col["sno"],
+        "scheme_id": scheme_id,
+        "scheme_name": scheme_name,
+    }
 
-    # Robust numeric conversion
-    for c in ["Daily Water Demand (m^3)", "Yesterday Water Production (m^3)", "Today Water Production (m^3)"]:
-        work_df[c] = pd.to_numeric(work_df[c], errors="coerce")
-
-    work_df["Percentage"] = (work_df["Yesterday Water Production (m^3)"] / work_df["Daily Water Demand (m^3)"]) * 100
-
-    # Sheet: SUPPLIED WATER LESS THAN threshold
-    less_df = work_df[work_df["Percentage"].fillna(0) < threshold].copy()
-    less_df["Supplied Water Percentage"] = f"<{threshold:g}%"
-    less_df.insert(0, "SR.No.", range(1, len(less_df) + 1))
-    less_df = less_df.drop(columns=["Today Water Production (m^3)"])
-
-    # Valid scheme rows
-    valid_scheme = (
-        work_df["Scheme Id"].notna()
-        & work_df["Scheme Name"].notna()
-        & (work_df["Scheme Id"].astype(str).str.strip().str.lower() != "none")
-        & (work_df["Scheme Name"].astype(str).str.strip().str.lower() != "none")
-        & (work_df["Scheme Id"].astype(str).str.strip() != "")
-        & (work_df["Scheme Name"].astype(str).str.strip() != "")
-    )
+    for field in SCHEME_NUMERIC_FIELDS:
+        values = pd.to_numeric(col[field], errors="coerce")
+        out[field] = pd.Series(values.to_numpy(dtype="float64", na_value=np.nan), index=values.index)
 
-    # Sheet: ZERO(INACTIVE SITES)
-    de_blank = work_df["Yesterday Water Production (m^3)"].isna() & work_df["Today Water Production (m^3)"].isna()
+    pump = col["pump_status"]
+    out["pump_status"] = pump.where(pump.isna(), _stripped_text(pump).str.upper()).astype("category")
+    out["last_data_date"] = _parse_receive_dates(col["last_data_date"])
 
-    zero_mask = (
-        valid_scheme
-        & (~de_blank)
-        & (work_df["Yesterday Water Production (m^3)"].fillna(0) == 0)
-        & (work_df["Today Water Production (m^3)"].fillna(0) == 0)
-    )
+    out["valid_scheme"] = _named_rows(scheme_id) & _named_rows(scheme_name)
+    out["site_key"] = scheme_site_keys(scheme_id, scheme_name)
 
-    zero_df = work_df.loc[zero_mask, [
-        "Scheme Id",
-        "Scheme Name",
-        "Yesterday Water Production (m^3)",
-        "Today Water Production (m^3)"
-    ]].copy()
+    out = {field: out[field] for field in SCHEME_FRAME_COLUMNS}
+    return pd.DataFrame(out, copy=False).set_axis(pd.RangeIndex(len(df)), axis=0)
 
-    zero_df["Last Data Receive Date"] = df.loc[zero_df.index, last_date_col].values
-    zero_df["Site Status"] = "ZERO/INACTIVE SITE"
-    zero_df.insert(0, "SR.No.", range(1, len(zero_df) + 1))
 
-    # Sheet: TODAY ZERO SITES
-    today_zero_mask = valid_scheme & (work_df["Today Water Production (m^3)"].fillna(0) == 0)
+def as_scheme_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Builders accept either a raw source frame or an already typed scheme frame."""
+    if list(df.columns) == SCHEME_FRAME_COLUMNS:
+        return df
+    return build_scheme_frame(df)
 
-    today_zero_df = work_df.loc[today_zero_mask, [
-        "Scheme Id",
-        "Scheme Name",
-        "Today Water Production (m^3)"
-    ]].copy()
 
-    today_zero_df["Last Data Receive Date"] = df.loc[today_zero_df.index, last_date_col].values
-    today_zero_df["Site Status"] = "ZERO/INACTIVE SITE"
-    today_zero_df.insert(0, "SR.No.", range(1, len(today_zero_df) + 1))
+# ---------------------------
+# Abnormal rules
+# ---------------------------
+ABNORMAL_RULES_PATH = Path(os.environ.get("JJM_ABNORMAL_RULES") or Path(__file__).with_name("abnormal_rules.json"))
 
-    today_zero_df = today_zero_df[[
-        "SR.No.",
-        "Scheme Id",
-        "Scheme Name",
-        "Today Water Production (m^3)",
-        "Last Data Receive Date",
-        "Site Status",
-    ]]
+# pandas.Series.between inclusive= values -> (low inclusive, high inclusive)
+RANGE_INCLUSIVE = {"both": (True, True), "left": (True, False), "right": (False, True), "neither": (False, False)}
 
-    return less_df, zero_df, today_zero_df
+RULE_KEYS = {"column", "field", "label", "note", "normal", "normal_by_pump_status", "when_zero"}
 
 
-def build_lpcd_status(df: pd.DataFrame) -> pd.DataFrame:
-    df = flatten_columns(df)
+def _normal_range(spec: dict, where: str) -> tuple:
+    """(low, high, low inclusive, high inclusive) of a {"min", "max", "inclusive"} rule range."""
+    unknown = set(spec) - {"min", "max", "inclusive"}
+    if unknown:
+        raise ValueError(f"{where}: unknown range keys {sorted(unknown)}")
+    inclusive = spec.get("inclusive", "both")
+    if inclusive not in RANGE_INCLUSIVE:
+        raise ValueError(f"{where}: inclusive must be one of {sorted(RANGE_INCLUSIVE)}, got {inclusive!r}")
+    return float(spec.get("min", -np.inf)), float(spec.get("max", np.inf)), *RANGE_INCLUSIVE[inclusive]
 
-    if df.shape[1] < 20:
-        raise ValueError(
-            f"Source file has only {df.shape[1]} columns. Need at least 20 columns to extract A,B,C,R,S,T."
-        )
 
-    lpcd_df = df.iloc[:, [0, 1, 2, 17, 18, 19]].copy()
-    lpcd_df.columns = [
-        "Sno.",
-        "Scheme Id",
-        "Scheme Name",
-        "Avg LPCD (Yesterday)",
-        "Avg LPCD (Weekly)",
-        "Avg LPCD (Monthly)",
-    ]
+def _closed_bounds(low: float, high: float, low_inclusive: bool, high_inclusive: bool) -> tuple:
+    """Same range as closed float bounds: x > a is x >= nextafter(a, +inf), so one comparison pair covers all."""
+    if not low_inclusive:
+        low = np.nextafter(low, np.inf)
+    if not high_inclusive:
+        high = np.nextafter(high, -np.inf)
+    return low, high
 
-    for c in ["Avg LPCD (Yesterday)", "Avg LPCD (Weekly)", "Avg LPCD (Monthly)"]:
-        lpcd_df[c] = pd.to_numeric(lpcd_df[c], errors="coerce")
 
-    return lpcd_df
+def _range_text(low: float, high: float, low_inclusive: bool, high_inclusive: bool) -> str:
+    """Excel note text of a normal range, e.g. "15 to 22.5", "0+ to 6.5", ">=55"."""
+    if np.isinf(high):
+        return f"{'>=' if low_inclusive else '>'}{low:g}"
+    if np.isinf(low):
+        return f"{'<=' if high_inclusive else '<'}{high:g}"
+    return f"{low:g}{'' if low_inclusive else '+'} to {high:g}{'' if high_inclusive else '-'}"
 
 
-def build_abnormal_sites(df: pd.DataFrame) -> pd.DataFrame:
+class AbnormalRules:
     """
-    Creates ABNORMAL SITES sheet with only those sites having at least one abnormal value.
-    Blank/NaN source values stay blank (not displayed as abnormal).
+    Compiled abnormal rule table. Rule j owns column j of a 2-D KPI array; a reading is abnormal
+    when it is present, every `when_zero` field is 0, and it lies outside its normal range
+    (per pump status for `normal_by_pump_status`; no range at all means always abnormal).
     """
-    df = flatten_columns(df)
-    norm = normalize_columns(df)
-
-    # Core identifier columns
-    sno_col = df.columns[0]
-    scheme_id_col = find_col_contains(norm, "schemeid")
-    scheme_name_col = find_col_contains(norm, "schemename")
-    pump_status_col = find_col_contains(norm, "pumpstatus")
-
-    # Source KPI columns
-    hydro_col = find_col_contains(norm, "groundwaterdepth", "avg", "meter")
-    chlorine_col = find_col_contains(norm, "chlorine", "ppm")
-    pressure_col = find_col_contains(norm, "pressure", "bar")
-    turbidity_col = find_col_contains(norm, "turbidity", "ntu")
-    voltage_col = find_col_contains(norm, "voltagern")
-    today_prod_col = find_col_contains(norm, "today", "waterproduction", "meter3")
-    overall_prod_col = find_col_contains(norm, "overallproductionwater", "meter3")
-
-    # OHT yesterday supply column
-    yest_supply_col = None
-    for c, cn in norm.items():
-        if ("oht" in cn) and ("watersupply" in cn) and ("meter3" in cn) and ("yesterday" in cn):
-            yest_supply_col = c
-            break
-    if yest_supply_col is None:
-        raise KeyError("Could not find 'OHT Water Supply (Meter3) Yesterday' column.")
-
-    # Weekly LPCD column
-    lpcd_weekly_col = None
-    for c, cn in norm.items():
-        if ("avglpcd" in cn or "lpcd" in cn) and ("weekly" in cn):
-            lpcd_weekly_col = c
-            break
-    if lpcd_weekly_col is None:
-        raise KeyError("Could not find weekly LPCD column.")
-
-    # OHT level / radar column
-    radar_col = None
-    for c, cn in norm.items():
-        if "ohtlevel" in cn and "valueinm" in cn:
-            radar_col = c
-            break
-    if radar_col is None:
-        raise KeyError("Could not find 'OHT Level (Value in M)' column.")
-
-    abnormal_df = df[[
-        sno_col,
-        scheme_id_col,
-        scheme_name_col,
-        hydro_col,
-        chlorine_col,
-        radar_col,
-        pressure_col,
-        turbidity_col,
-        voltage_col,
-        lpcd_weekly_col,
-        overall_prod_col,
-        pump_status_col,
-        today_prod_col,
-        yest_supply_col,
-    ]].copy()
-
-    abnormal_df.columns = [
-        "Sr.no",
-        "Scheme Id",
-        "Scheme Name",
-        "Abnormal Hydrostatic Level",
-        "Chlorine(PPM)",
-        "Abnormal Radar Level",
-        "Abnormal Pressure(BAR) Reading",
-        "Abnormal Turbidity (NTU)",
-        "Abnormal Voltage",
-        "Abnormal LPCD",
-        "Static Totalizer",
-        "Pump Status",
-        "Today Water Production (Meter3)",
-        "Yesterday OHT Water Supply (Meter3)",
-    ]
 
-    numeric_cols = [
-        "Abnormal Hydrostatic Level",
-        "Chlorine(PPM)",
-        "Abnormal Radar Level",
-        "Abnormal Pressure(BAR) Reading",
-        "Abnormal Turbidity (NTU)",
-        "Abnormal Voltage",
-        "Abnormal LPCD",
-        "Static Totalizer",
-        "Today Water Production (Meter3)",
-        "Yesterday OHT Water Supply (Meter3)",
-    ]
-    for c in numeric_cols:
-        abnormal_df[c] = pd.to_numeric(abnormal_df[c], errors="coerce")
-
-    abnormal_df["Pump Status"] = abnormal_df["Pump Status"].astype(str).str.strip().str.upper()
-
-    hydro_vals = abnormal_df["Abnormal Hydrostatic Level"]
-    chlorine_vals = abnormal_df["Chlorine(PPM)"]
-    radar_vals = abnormal_df["Abnormal Radar Level"]
-    pressure_vals = abnormal_df["Abnormal Pressure(BAR) Reading"]
-    turbidity_vals = abnormal_df["Abnormal Turbidity (NTU)"]
-    voltage_vals = abnormal_df["Abnormal Voltage"]
-    lpcd_vals = abnormal_df["Abnormal LPCD"]
-    totalizer_vals = abnormal_df["Static Totalizer"]
-    today_vals = abnormal_df["Today Water Production (Meter3)"]
-    yest_vals = abnormal_df["Yesterday OHT Water Supply (Meter3)"]
-    pump_vals = abnormal_df["Pump Status"]
-
-    # Abnormal rules
-    hydro_abnormal = hydro_vals.notna() & ~hydro_vals.between(15, 22.5, inclusive="both")
-    chlorine_abnormal = chlorine_vals.notna() & ~chlorine_vals.between(0.15, 0.5, inclusive="both")
-    radar_abnormal = radar_vals.notna() & ~((radar_vals > 0) & (radar_vals <= 6.5))
-    turbidity_abnormal = turbidity_vals.notna() & ~((turbidity_vals >= 0) & (turbidity_vals <= 5))
-    voltage_abnormal = voltage_vals.notna() & ((voltage_vals <= 0) | (voltage_vals < 215) | (voltage_vals > 240))
-    lpcd_abnormal = lpcd_vals.notna() & (lpcd_vals < 55)
-
-    # Pressure logic depends on Pump Status
-    pressure_abnormal = pd.Series(False, index=abnormal_df.index)
-
-    pressure_on_mask = pressure_vals.notna() & (pump_vals == "ON")
-    pressure_off_mask = pressure_vals.notna() & (pump_vals == "OFF")
-    pressure_other_mask = pressure_vals.notna() & ~(pump_vals.isin(["ON", "OFF"]))
-
-    pressure_abnormal.loc[pressure_on_mask] = ~pressure_vals.loc[pressure_on_mask].between(1.45, 1.95, inclusive="both")
-    pressure_abnormal.loc[pressure_off_mask] = ~(pressure_vals.loc[pressure_off_mask] == 0)
-    pressure_abnormal.loc[pressure_other_mask] = True
-
-    # Static Totalizer abnormal only when Today Production = 0 AND Yesterday OHT Supply = 0
-    totalizer_abnormal = (
-        totalizer_vals.notna()
-        & today_vals.notna()
-        & yest_vals.notna()
-        & (today_vals == 0)
-        & (yest_vals == 0)
+    def __init__(self, rules: list, version: str):
+        if not rules:
+            raise ValueError("The abnormal rule table is empty.")
+
+        self.rules = rules
+        self.version = version
+        self.columns = []
+        self.fields = []
+        self.labels = []
+        self.notes = []
+        self.pump_cases = []
+        self.when_zero = []
+        bounds = []
+
+        for j, rule in enumerate(rules):
+            where = f"abnormal rule {j + 1}"
+            unknown = set(rule) - RULE_KEYS
+            if unknown:
+                raise ValueError(f"{where}: unknown keys {sorted(unknown)}")
+            if "normal" in rule and "normal_by_pump_status" in rule:
+                raise ValueError(f"{where}: use either normal or normal_by_pump_status")
+            for field in [rule.get("field"), *rule.get("when_zero", [])]:
+                if field not in SCHEME_NUMERIC_FIELDS:
+                    raise ValueError(f"{where}: unknown field {field!r}, expected one of {SCHEME_NUMERIC_FIELDS}")
+
+            column = rule.get("column") or rule["field"]
+            if column in self.columns or column in ("Sr.no", "Scheme Id", "Scheme Name"):
+                raise ValueError(f"{where}: duplicate column {column!r}")
+
+            self.columns.append(column)
+            self.fields.append(rule["field"])
+            self.labels.append(rule.get("label") or column)
+
+            if "normal_by_pump_status" in rule:
+                cases = [
+                    (str(status).strip().upper(), _normal_range(spec, f"{where} ({status})"))
+                    for status, spec in rule["normal_by_pump_status"].items()
+                ]
+                self.pump_cases.append((j, [(status, _closed_bounds(*r)) for status, r in cases]))
+                # Evaluated per pump status; the shared pass treats the column as never normal.
+                bounds.append((np.nan, np.nan))
+                note_range = cases[0][1] if cases else None
+            elif "normal" in rule:
+                note_range = _normal_range(rule["normal"], where)
+                bounds.append(_closed_bounds(*note_range))
+            else:
+                bounds.append((np.nan, np.nan))
+                note_range = None
+
+            if rule.get("note") and note_range is not None:
+                self.notes.append((rule["note"], _range_text(*note_range)))
+            if rule.get("when_zero"):
+                self.when_zero.append((j, rule["when_zero"]))
+
+        self.low = np.array([b[0] for b in bounds], dtype="float64")
+        self.high = np.array([b[1] for b in bounds], dtype="float64")
+
+    def kpi_array(self, sf: pd.DataFrame) -> np.ndarray:
+        """(rows, rules) float64 array of the reading each rule checks, column-major so rule columns are contiguous."""
+        kpis = np.empty((len(sf), len(self.fields)), dtype="float64", order="F")
+        for j, field in enumerate(self.fields):
+            kpis[:, j] = sf[field].to_numpy(dtype="float64")
+        return kpis
+
+    def evaluate(self, sf: pd.DataFrame, kpis: np.ndarray | None = None) -> np.ndarray:
+        """(rows, rules) boolean abnormal mask for a typed scheme frame, in one pass over the KPI array."""
+        if kpis is None:
+            kpis = self.kpi_array(sf)
+
+        with np.errstate(invalid="ignore"):
+            normal = (kpis >= self.low) & (kpis <= self.high)
+
+            pump = sf["pump_status"]
+            pump_rows = {}
+            for j, cases in self.pump_cases:
+                values = kpis[:, j]
+                for status, (lo, hi) in cases:
+                    if status not in pump_rows:
+                        pump_rows[status] = (pump == status).to_numpy()
+                    normal[:, j] |= pump_rows[status] & (values >= lo) & (values <= hi)
+
+        abnormal = ~np.isnan(kpis) & ~normal
+
+        zero_rows = {}
+        for j, fields in self.when_zero:
+            for field in fields:
+                if field not in zero_rows:
+                    zero_rows[field] = sf[field].to_numpy() == 0
+                abnormal[:, j] &= zero_rows[field]
+        return abnormal
+
+
+def load_abnormal_rules(path: Path = ABNORMAL_RULES_PATH) -> AbnormalRules:
+    """
+    Rule table from a JSON file ({"rules": [...]}, see abnormal_rules.json). Read on every rerun,
+    so seasonal threshold edits apply without a restart; `version` changes with the rule content.
+    """
+    try:
+        rules = json.loads(Path(path).read_text(encoding="utf-8"))["rules"]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Could not read abnormal rules from {path}: {e}") from e
+
+    version = hashlib.sha1(json.dumps(rules, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return AbnormalRules(rules, version)
+
+
+ABNORMAL_RULES = load_abnormal_rules()
+
+
+# ---------------------------
+# Business logic
+# ---------------------------
+REPORT_FRAME_KEYS = ["less_df", "zero_df", "today_zero_df", "lpcd_df", "abnormal_df"]
+REPORT_SUMMARY_KEYS = ["critical_df", "site_status_df", "status_summary", "severity_summary", "abnormal_param_summary", "lpcd_summary"]
+REPORT_KEYS = REPORT_FRAME_KEYS + REPORT_SUMMARY_KEYS
+THRESHOLD_FRAME_KEYS = ["less_df", "site_status_df", "status_summary", "severity_summary"]
+THRESHOLD_CURVE_POINTS = list(range(10, 101, 5))
+
+# LPCD STATUS columns averaged for the dashboard metrics and the sheet's Average row
+LPCD_AVERAGE_COLUMNS = ["Avg LPCD (Yesterday)", "Avg LPCD (Weekly)", "Avg LPCD (Monthly)"]
+
+SEVERITY_RANK = {"HIGH": 1, "MEDIUM": 2, "LOW": 3, "Normal": 4}
+SEVERITY_LABELS = np.array(list(SEVERITY_RANK), dtype=object)  # by rank - 1
+
+# Supply-severity bucket edges (%) below the threshold; the threshold and 100% close the scale.
+SEVERITY_EDGES = [float(x) for x in os.environ.get("JJM_SEVERITY_EDGES", "25,50").split(",") if x.strip()]
+if any(b <= a for a, b in zip(SEVERITY_EDGES, SEVERITY_EDGES[1:])):
+    raise ValueError(f"JJM_SEVERITY_EDGES must be increasing, got {SEVERITY_EDGES}")
+
+
+def severity_labels(threshold: float, edges: list = SEVERITY_EDGES) -> list:
+    """Supply-severity buckets in order, e.g. <25%, 25–50%, 50–75%, 75–100%, >100%, Unknown."""
+    if edges:
+        below = [f"<{edges[0]:g}%", *[f"{a:g}–{b:g}%" for a, b in zip(edges, edges[1:])], f"{edges[-1]:g}–{threshold:g}%"]
+    else:
+        below = [f"<{threshold:g}%"]
+    return [*below, f"{threshold:g}–100%", ">100%", "Unknown"]
+
+
+class SupplySweep:
+    """
+    Supply percentages sorted once, so any threshold is a searchsorted slice: the rows below it
+    (blank counts as 0%, as in the SUPPLIED WATER LESS THAN sheet) and the severity bucket counts
+    over valid schemes (blank as Unknown).
+    """
+
+    def __init__(self, percentage: np.ndarray, valid: np.ndarray):
+        key = np.nan_to_num(percentage)
+        self.order = np.argsort(key, kind="stable")
+        self.sorted = key[self.order]
+
+        valid_pct = np.sort(percentage[valid])
+        self.n_known = int(np.count_nonzero(~np.isnan(valid_pct)))
+        self.valid_sorted = valid_pct[:self.n_known]
+        self.n_unknown = len(valid_pct) - self.n_known
+
+    def less_mask(self, threshold: float) -> np.ndarray:
+        mask = np.zeros(len(self.order), dtype=bool)
+        mask[self.order[:np.searchsorted(self.sorted, threshold, side="left")]] = True
+        return mask
+
+    def less_counts(self, thresholds) -> np.ndarray:
+        """Number of rows below each threshold, for any number of thresholds at once."""
+        return np.searchsorted(self.sorted, np.asarray(thresholds, dtype="float64"), side="left")
+
+    def severity_counts(self, threshold: float, edges: list = SEVERITY_EDGES) -> np.ndarray:
+        """
+        Count per severity_labels() bucket: right-open bins up to the threshold, threshold–100%
+        closed at 100, blank as Unknown. A threshold below an edge empties its bins, the same
+        as checking the bins in order.
+        """
+        bounds = np.maximum.accumulate([*edges, threshold, np.nextafter(100.0, np.inf)])
+        below = np.searchsorted(self.valid_sorted, bounds, side="left")
+        return np.diff([0, *below, self.n_known, self.n_known + self.n_unknown])
+
+
+def threshold_curve(sweep: SupplySweep, thresholds) -> pd.DataFrame:
+    """Sites below each threshold (%), e.g. for 50, 60, 75 and 90."""
+    thresholds = np.asarray(thresholds, dtype="float64")
+    return pd.DataFrame({"Threshold (%)": thresholds, "Sites": sweep.less_counts(thresholds)})
+
+
+def classify_site_status(zero, today_zero, less, abnormal, threshold: float) -> np.ndarray:
+    """
+    Site Status from boolean membership arrays aligned on one site index; earlier statuses win.
+    Rows share the five label strings (an object array), rather than each holding a copy.
+    """
+    labels = np.array(
+        ["Zero / Inactive", "Today Zero", f"Supply < {threshold:g}%", "Abnormal Reading", "Healthy / Normal"],
+        dtype=object,
     )
+    return labels[np.select([zero, today_zero, less, abnormal], [0, 1, 2, 3], 4)]
 
-    # Keep only abnormal values, blank out normal values
-    abnormal_df.loc[~hydro_abnormal, "Abnormal Hydrostatic Level"] = pd.NA
-    abnormal_df.loc[~chlorine_abnormal, "Chlorine(PPM)"] = pd.NA
-    abnormal_df.loc[~radar_abnormal, "Abnormal Radar Level"] = pd.NA
-    abnormal_df.loc[~pressure_abnormal, "Abnormal Pressure(BAR) Reading"] = pd.NA
-    abnormal_df.loc[~turbidity_abnormal, "Abnormal Turbidity (NTU)"] = pd.NA
-    abnormal_df.loc[~voltage_abnormal, "Abnormal Voltage"] = pd.NA
-    abnormal_df.loc[~lpcd_abnormal, "Abnormal LPCD"] = pd.NA
-    abnormal_df.loc[~totalizer_abnormal, "Static Totalizer"] = pd.NA
-
-    keep_cols = [
-        "Abnormal Hydrostatic Level",
-        "Chlorine(PPM)",
-        "Abnormal Radar Level",
-        "Abnormal Pressure(BAR) Reading",
-        "Abnormal Turbidity (NTU)",
-        "Abnormal Voltage",
-        "Abnormal LPCD",
-        "Static Totalizer",
-    ]
 
-    # Keep only rows having at least one abnormal reading
-    at_least_one_abnormal = abnormal_df[keep_cols].notna().any(axis=1)
-    abnormal_df = abnormal_df.loc[at_least_one_abnormal, [
-        "Sr.no",
-        "Scheme Id",
-        "Scheme Name",
-        "Abnormal Hydrostatic Level",
-        "Chlorine(PPM)",
-        "Abnormal Radar Level",
-        "Abnormal Pressure(BAR) Reading",
-        "Abnormal Turbidity (NTU)",
-        "Abnormal Voltage",
-        "Abnormal LPCD",
-        "Static Totalizer",
-    ]].copy()
-
-    abnormal_df.reset_index(drop=True, inplace=True)
-    return abnormal_df
+def site_status_counts(site_status_df: pd.DataFrame) -> pd.DataFrame:
+    """Status / Count table; value_counts breaks ties by the sites' order."""
+    return (
+        site_status_df["Site Status"]
+        .value_counts()
+        .rename_axis("Status")
+        .reset_index(name="Count")
+    )
+
+
+def lpcd_summary(columns: dict) -> pd.DataFrame:
+    """Mean of every LPCD average column over its numeric readings (NaN without any), indexed by column."""
+    means = [pd.to_numeric(pd.Series(values), errors="coerce").mean() for values in columns.values()]
+    return pd.DataFrame({"Average": means}, index=pd.Index(list(columns), name="Column"))
+
+
+class ReportPipeline:
+    """
+    Single pass over one typed scheme frame: the supply percentage, the validity and per-KPI
+    abnormal masks are computed once, and every sheet and dashboard summary is sliced from them.
+    Every result frame is indexed by site key.
+    """
+
+    def __init__(self, df: pd.DataFrame, threshold: float = 75.0, rules: AbnormalRules | None = None):
+        self.sf = as_scheme_frame(df)
+        self.rules = rules or ABNORMAL_RULES
+        sf = self.sf
+
+        self.valid = sf["valid_scheme"].to_numpy()
+        self.keys = sf["site_key"].to_numpy()
+        self.demand = sf["daily_demand"].to_numpy()
+        self.yest = sf["yest_supply"].to_numpy()
+        self.today = sf["today_prod"].to_numpy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.percentage = self.yest / self.demand * 100
+
+        yest_zero = np.nan_to_num(self.yest) == 0
+        today_zero = np.nan_to_num(self.today) == 0
+        both_blank = np.isnan(self.yest) & np.isnan(self.today)
+
+        self.sweep = SupplySweep(self.percentage, self.valid)
+        self.zero_mask = self.valid & ~both_blank & yest_zero & today_zero
+        self.today_zero_mask = self.valid & today_zero
+
+        self.kpis = self.rules.kpi_array(sf)
+        self.abnormal = self.rules.evaluate(sf, self.kpis)
+        self.abnormal_count = self.abnormal.sum(axis=1)
+        self.abnormal_mask = self.abnormal_count > 0
+
+        self.sheet_masks = {
+            "zero_df": self.zero_mask,
+            "today_zero_df": self.today_zero_mask,
+            "lpcd_df": None,
+            "abnormal_df": self.abnormal_mask,
+        }
+        self.set_threshold(threshold)
+
+    def set_threshold(self, threshold: float) -> None:
+        self.threshold = threshold
+        self.less_mask = self.sweep.less_mask(threshold)
+        self.sheet_masks["less_df"] = self.less_mask
+
+    def at_threshold(self, threshold: float) -> "ReportPipeline":
+        """A copy for another threshold; every array but the below-threshold mask is shared."""
+        other = copy.copy(self)
+        other.sheet_masks = dict(self.sheet_masks)
+        other.set_threshold(threshold)
+        return other
+
+    def count(self, name: str) -> int:
+        """Number of rows of sheet `name`, without building it."""
+        mask = self.sheet_masks[name]
+        return len(self.sf) if mask is None else int(np.count_nonzero(mask))
+
+    def _positions(self, mask: np.ndarray | None) -> np.ndarray:
+        return np.arange(len(self.sf)) if mask is None else np.flatnonzero(mask)
+
+    def _rows(self, mask: np.ndarray | None, columns: dict) -> pd.DataFrame:
+        """Sheet rows under `mask` (None: every row): output column -> scheme-frame field, indexed by site key."""
+        pos = self._positions(mask)
+        cols = {out: self.sf[field] for out, field in columns.items()}
+        if mask is not None:
+            cols = {out: col.iloc[pos] for out, col in cols.items()}
+        sheet = pd.DataFrame(cols, copy=False)
+        return sheet.set_axis(pd.Index(self.keys[pos], name=SITE_KEY), axis=0)
+
+    @staticmethod
+    def _number(sheet: pd.DataFrame, column: str = "SR.No.") -> pd.DataFrame:
+        sheet.insert(0, column, range(1, len(sheet) + 1))
+        return sheet
+
+    def less_df(self) -> pd.DataFrame:
+        """SUPPLIED WATER LESS THAN threshold (Yesterday / Demand, blank counts as 0%)."""
+        sheet = self._rows(self.less_mask, {
+            "Scheme Id": "scheme_id",
+            "Scheme Name": "scheme_name",
+            "Daily Water Demand (m^3)": "daily_demand",
+            "Yesterday Water Production (m^3)": "yest_supply",
+        })
+        sheet["Percentage"] = self.percentage[self.less_mask]
+        sheet["Supplied Water Percentage"] = f"<{self.threshold:g}%"
+        return self._number(sheet)
+
+    def zero_df(self) -> pd.DataFrame:
+        """ZERO(INACTIVE SITES): Yesterday == 0 AND Today == 0, excluding both blank."""
+        sheet = self._rows(self.zero_mask, {
+            "Scheme Id": "scheme_id",
+            "Scheme Name": "scheme_name",
+            "Yesterday Water Production (m^3)": "yest_supply",
+            "Today Water Production (m^3)": "today_prod",
+            "Last Data Receive Date": "last_data_date",
+        })
+        sheet["Site Status"] = "ZERO/INACTIVE SITE"
+        return self._number(sheet)
+
+    def today_zero_df(self) -> pd.DataFrame:
+        """TODAY ZERO SITES: Today == 0 or blank, regardless of yesterday."""
+        sheet = self._rows(self.today_zero_mask, {
+            "Scheme Id": "scheme_id",
+            "Scheme Name": "scheme_name",
+            "Today Water Production (m^3)": "today_prod",
+            "Last Data Receive Date": "last_data_date",
+        })
+        sheet["Site Status"] = "ZERO/INACTIVE SITE"
+        return self._number(sheet)
+
+    def lpcd_df(self) -> pd.DataFrame:
+        return self._rows(None, {
+            "Sno.": "sno",
+            "Scheme Id": "scheme_id",
+            "Scheme Name": "scheme_name",
+            **dict(zip(LPCD_AVERAGE_COLUMNS, LPCD_FIELDS)),
+        })
+
+    def abnormal_df(self) -> pd.DataFrame:
+        """ABNORMAL SITES: rows with at least one abnormal reading; normal readings are blanked."""
+        sheet = self._rows(self.abnormal_mask, {
+            "Sr.no": "sno",
+            "Scheme Id": "scheme_id",
+            "Scheme Name": "scheme_name",
+        })
+        rows = self.abnormal_mask
+        values = np.where(self.abnormal[rows], self.kpis[rows], np.nan)
+        for j, column in enumerate(self.rules.columns):
+            sheet[column] = values[:, j]
+        return sheet
+
+    def critical_df(self) -> pd.DataFrame:
+        """CRITICAL SITES: abnormal sites by abnormality count, then Normal sites with no abnormal KPI."""
+        keys = self.keys
+        abnormal_keys = np.unique(keys[self.abnormal_mask & (keys >= 0)])
+        normal = (keys >= 0) & ~np.isin(keys, abnormal_keys)
+
+        count = self.abnormal_count[self.abnormal_mask].astype("int64")
+        rank = np.select([count >= 6, count >= 3], [SEVERITY_RANK["HIGH"], SEVERITY_RANK["MEDIUM"]], SEVERITY_RANK["LOW"])
+        abnormal_part = self._rows(self.abnormal_mask, {
+            "Sr.no": "sno",
+            "Scheme Id": "scheme_id",
+            "Scheme Name": "scheme_name",
+        })
+        abnormal_part["Abnormality Count"] = count
+        abnormal_part["Severity Score"] = SEVERITY_LABELS[rank - 1]
+
+        normal_part = self._rows(normal, {
+            "Sr.no": "sno",
+            "Scheme Id": "scheme_id",
+            "Scheme Name": "scheme_name",
+        })
+        normal_part["Abnormality Count"] = 0
+        normal_part["Severity Score"] = "Normal"
+
+        parts = [part for part in (abnormal_part, normal_part) if not part.empty]
+        if not parts:
+            return pd.DataFrame(
+                columns=["Sr.no", "Scheme Id", "Scheme Name", "Abnormality Count", "Severity Score"],
+                index=pd.Index([], dtype=np.int64, name=SITE_KEY),
+            )
+
+        critical = pd.concat(parts)
+        ranks = np.concatenate([rank, np.full(len(normal_part), SEVERITY_RANK["Normal"])])
+        # HIGH -> MEDIUM -> LOW -> Normal, most abnormal KPIs first; a stable sort keeps row order within ties
+        return critical.iloc[np.lexsort((-critical["Abnormality Count"].to_numpy(), ranks))]
+
+    def site_status_df(self) -> pd.DataFrame:
+        """
+        Site Status of every unique Scheme Id | Scheme Name site, in order of first appearance;
+        a site takes the first matching status of Zero / Inactive, Today Zero, Supply < threshold,
+        Abnormal Reading.
+        """
+        keys = self.keys
+        keyed = np.flatnonzero(keys >= 0)
+        uniq, first, inverse = np.unique(keys[keyed], return_index=True, return_inverse=True)
+
+        def any_per_site(mask):
+            return np.bincount(inverse, weights=mask[keyed], minlength=len(uniq)) > 0
+
+        status = classify_site_status(
+            any_per_site(self.zero_mask),
+            any_per_site(self.today_zero_mask),
+            any_per_site(self.less_mask),
+            any_per_site(self.abnormal_mask),
+            self.threshold,
+        )
+
+        # A site's first row: in row order, so the sites come out in order of first appearance
+        first_rows = np.zeros(len(keys), dtype=bool)
+        first_rows[keyed[first]] = True
+        sheet = self._rows(first_rows, {"Scheme Id": "scheme_id", "Scheme Name": "scheme_name"})
+        sheet["Site Status"] = status[np.argsort(first, kind="stable")]
+        return sheet
+
+    def status_summary(self) -> pd.DataFrame:
+        return site_status_counts(self.site_status_df())
+
+    def severity_summary(self) -> pd.DataFrame:
+        """Supply severity over ALL valid schemes, so that 75%-100% sites are also included."""
+        labels = np.array(severity_labels(self.threshold))
+        counts = self.sweep.severity_counts(self.threshold)
+        present = labels[counts > 0]
+        return pd.DataFrame({
+            "Severity": pd.Categorical(present, categories=present, ordered=True),
+            "Count": counts[counts > 0],
+        })
+
+    def abnormal_param_summary(self) -> pd.DataFrame:
+        if not self.abnormal_mask.any():
+            return pd.DataFrame(columns=["Parameter", "Count"])
+
+        summary = pd.DataFrame({
+            "Parameter": self.rules.labels,
+            "Count": self.abnormal.sum(axis=0),
+        })
+        return summary[summary["Count"] > 0]
+
+    def lpcd_summary(self) -> pd.DataFrame:
+        """LPCD averages straight from the scheme frame, shared by the dashboard and the workbook."""
+        return lpcd_summary({name: self.sf[field] for name, field in zip(LPCD_AVERAGE_COLUMNS, LPCD_FIELDS)})
+
+    def frames(self) -> dict:
+        """Every sheet and dashboard summary, built at once."""
+        return {name: getattr(self, name)() for name in REPORT_KEYS}
+
+
+class LazyReport(Mapping):
+    """
+    Every sheet and dashboard summary of one ReportPipeline, each built on first access
+    (a preview, a tab, the Excel export) and cached. Row counts come from the pipeline's masks,
+    so the headline metrics never build a sheet.
+    """
+
+    def __init__(self, pipeline: ReportPipeline, frames: dict | None = None):
+        self.pipeline = pipeline
+        self._frames = dict(frames or {})
+
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        if name not in self._frames:
+            if name not in REPORT_KEYS:
+                raise KeyError(name)
+            self._frames[name] = getattr(self.pipeline, name)()
+        return self._frames[name]
+
+    def __iter__(self):
+        return iter(REPORT_KEYS)
+
+    def __len__(self) -> int:
+        return len(REPORT_KEYS)
+
+    @property
+    def threshold(self) -> float:
+        return self.pipeline.threshold
+
+    def count(self, name: str) -> int:
+        return len(self._frames[name]) if name in self._frames else self.pipeline.count(name)
+
+    def retarget(self, threshold: float) -> "LazyReport":
+        """
+        The report at another threshold: frames that depend on it (THRESHOLD_FRAME_KEYS) are
+        re-sliced from the presorted percentages on access, the others are reused.
+        """
+        kept = {name: frame for name, frame in self._frames.items() if name not in THRESHOLD_FRAME_KEYS}
+        return LazyReport(self.pipeline.at_threshold(threshold), kept)
 
 
 # ---------------------------
 # Excel writing + formatting
 # ---------------------------
-def apply_formatting(xlsx_bytes: bytes) -> bytes:
-    wb = load_workbook(BytesIO(xlsx_bytes))
-
-    thin = Side(style="thin", color="000000")
-    border_all = Border(left=thin, right=thin, top=thin, bottom=thin)
-
-    align_center = Alignment(horizontal="center", vertical="center", wrap_text=False)
-    align_left = Alignment(horizontal="left", vertical="center", wrap_text=False)
-
-    header_font = Font(bold=True, color="000000")
-    header_fill = PatternFill("solid", fgColor="5B9BD5")
-
-    abnormal_fill = PatternFill("solid", fgColor="FFC7CE")   # light red
-    note_label_fill = PatternFill("solid", fgColor="D9EAF7") # light blue
-    note_value_fill = PatternFill("solid", fgColor="FFF2CC") # light yellow
-    avg_fill = PatternFill("solid", fgColor="E2F0D9")        # light green
-    note_font = Font(bold=True, color="000000")
-
-    def format_sheet(ws):
-        for cell in ws[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = align_center
-            cell.border = border_all
-
-        maxlen = {}
-        for r in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1, max_col=ws.max_column):
-            for cell in r:
-                cell.border = border_all
-                cell.alignment = align_left if cell.column == 3 else align_center
-                val = "" if cell.value is None else str(cell.value)
-                maxlen[cell.column] = max(maxlen.get(cell.column, 0), len(val))
-
-        for c in range(1, ws.max_column + 1):
-            header_val = str(ws.cell(row=1, column=c).value or "")
-            maxlen[c] = max(maxlen.get(c, 0), len(header_val))
-            width = maxlen.get(c, 0)
-            ws.column_dimensions[get_column_letter(c)].width = max(10, min(60, int(width * 1.2) + 2))
-
-    # -----------------------------
-    # LPCD STATUS
-    # -----------------------------
-    if "LPCD STATUS" in wb.sheetnames:
-        ws = wb["LPCD STATUS"]
-        format_sheet(ws)
-
-        last_data_row = ws.max_row
-        avg_row = last_data_row + 1
-
-        ws.cell(row=avg_row, column=3, value="Average")
-
-        for col in [4, 5, 6]:
-            values = [ws.cell(row=r, column=col).value for r in range(2, last_data_row + 1)]
-            s = pd.to_numeric(pd.Series(values), errors="coerce").dropna()
-            avg_val = round(float(s.mean()), 2) if not s.empty else None
-            cell = ws.cell(row=avg_row, column=col, value=avg_val)
-            cell.number_format = "0.00"
-
-        for col in range(1, ws.max_column + 1):
-            cell = ws.cell(row=avg_row, column=col)
-            cell.border = border_all
-            cell.alignment = align_left if col == 3 else align_center
-            cell.font = note_font
-            cell.fill = avg_fill
-
-    # -----------------------------
-    # FORMAT ALL EXISTING SHEETS
-    # -----------------------------
-    for sheet in [
-        "SUPPLIED WATER LESS THAN 75",
-        "ZERO(INACTIVE SITES)",
-        "TODAY ZERO SITES",
-        "CRITICAL SITES"   # NEW
-    ]:
-        if sheet in wb.sheetnames:
-            format_sheet(wb[sheet])
-
-    # -----------------------------
-    # ABNORMAL SITES
-    # -----------------------------
-    if "ABNORMAL SITES" in wb.sheetnames:
-        ws = wb["ABNORMAL SITES"]
-        format_sheet(ws)
-
-        data_last_row = ws.max_row
-
-        # Highlight all abnormal value columns (D onward) only where value exists
-        for row in range(2, data_last_row + 1):
-            for col in range(4, ws.max_column + 1):
-                cell = ws.cell(row=row, column=col)
-                if cell.value not in (None, ""):
-                    cell.fill = abnormal_fill
-                    cell.font = note_font
-
-        # Add acceptable / normal values at the bottom
-        start_row = ws.max_row + 2
-        notes = [
-            ("Normal Hydrostatic Level", "15 to 22.5"),
-            ("Normal Chlorine(PPM)", "0.15 to 0.5"),
-            ("Normal Radar Level", "0+ to 6.5"),
-            ("Normal Pressure(BAR)", "1.45 to 1.95"),
-            ("Normal Turbidity(NTU)", "0 to 5"),
-            ("Normal Voltage", "215 to 240"),
-            ("Normal LPCD", ">=55"),
-            
-        ]
+THIN = Side(style="thin", color="000000")
+BORDER_ALL = Border(left=THIN, right=THIN, top=THIN, bottom=THIN)
+
+ALIGN_CENTER = Alignment(horizontal="center", vertical="center", wrap_text=False)
+ALIGN_LEFT = Alignment(horizontal="left", vertical="center", wrap_text=False)
+
+HEADER_FONT = Font(bold=True, color="000000")
+HEADER_FILL = PatternFill("solid", fgColor="5B9BD5")
+
+ABNORMAL_FILL = PatternFill("solid", fgColor="FFC7CE", bgColor="FFC7CE")  # light red; conditional fills read bgColor
+NOTE_LABEL_FILL = PatternFill("solid", fgColor="D9EAF7") # light blue
+NOTE_VALUE_FILL = PatternFill("solid", fgColor="FFF2CC") # light yellow
+AVG_FILL = PatternFill("solid", fgColor="E2F0D9")        # light green
+NOTE_FONT = Font(bold=True, color="000000")
+
+# Dates as the portal shows them
+REPORT_DATE_FORMAT = "dd-mm-yyyy hh:mm:ss"
+
+# Named styles of the report workbook: (alignment, font, fill, number format)
+REPORT_STYLES = {
+    "report cell": (ALIGN_CENTER, None, None, None),
+    "report text": (ALIGN_LEFT, None, None, None),
+    "report date": (ALIGN_CENTER, None, None, REPORT_DATE_FORMAT),
+    "report header": (ALIGN_CENTER, HEADER_FONT, HEADER_FILL, None),
+    "report note label": (ALIGN_LEFT, NOTE_FONT, NOTE_LABEL_FILL, None),
+    "report note value": (ALIGN_CENTER, NOTE_FONT, NOTE_VALUE_FILL, None),
+    "report average label": (ALIGN_LEFT, NOTE_FONT, AVG_FILL, None),
+    "report average": (ALIGN_CENTER, NOTE_FONT, AVG_FILL, "0.00"),
+}
 
-        for i, (label, value) in enumerate(notes):
-            r = start_row + i
-            label_cell = ws.cell(row=r, column=1, value=label)
-            value_cell = ws.cell(row=r, column=2, value=value)
 
-            label_cell.font = note_font
-            value_cell.font = note_font
+def register_report_styles(wb: Workbook) -> None:
+    """Register every report style once per workbook; cells then refer to it by name."""
+    for name, (alignment, font, fill, number_format) in REPORT_STYLES.items():
+        style = NamedStyle(name=name, border=BORDER_ALL, alignment=alignment)
+        if font is not None:
+            style.font = font
+        if fill is not None:
+            style.fill = fill
+        if number_format is not None:
+            style.number_format = number_format
+        wb.add_named_style(style)
 
-            label_cell.fill = note_label_fill
-            value_cell.fill = note_value_fill
 
-            label_cell.alignment = align_left
-            value_cell.alignment = align_center
+def _styled_cell(ws, value, style: str = "report cell") -> WriteOnlyCell:
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
 
-            label_cell.border = border_all
-            value_cell.border = border_all
 
-        ws.column_dimensions["A"].width = max(ws.column_dimensions["A"].width or 10, 34)
-        ws.column_dimensions["B"].width = max(ws.column_dimensions["B"].width or 10, 42)
+def _sheet_rows(df: pd.DataFrame):
+    """Rows of Python values as ExcelWriter would write them, blanks as None."""
+    columns = [df[c].astype(object).where(df[c].notna(), None).tolist() for c in df.columns]
+    return zip(*columns)
 
-    out = BytesIO()
-    wb.save(out)
-    return out.getvalue()
+
+def _column_widths(df: pd.DataFrame) -> list:
+    """Auto-width of every column from its header and the text of its values, in Excel units."""
+    if df.empty:
+        longest = pd.Series(0, index=df.columns)
+    else:
+        longest = df.astype(str).apply(lambda col: col.str.len()).where(df.notna(), 0).max()
+    header = np.array([len(str(name)) for name in df.columns], dtype="int64")
+    longest = np.maximum(longest.fillna(0).to_numpy(dtype="int64"), header)
+    return np.clip((longest * 1.2).astype("int64") + 2, 10, 60).tolist()
+
+
+def write_report_sheet(wb: Workbook, title: str, df: pd.DataFrame, min_widths: dict | None = None, highlight_from: int | None = None):
+    """
+    Stream one formatted sheet into a write-only workbook: styled header, bordered rows with the
+    third column left-aligned, auto widths. With `highlight_from` (1-based), non-empty cells from
+    that column on are marked abnormal by a conditional format over the data range. Returns the
+    sheet so callers can append footer rows.
+    """
+    ws = wb.create_sheet(title)
+    min_widths = min_widths or {}
+
+    # Column widths go before the first row in a streamed sheet.
+    for c, width in enumerate(_column_widths(df), start=1):
+        letter = get_column_letter(c)
+        ws.column_dimensions[letter].width = max(width, min_widths.get(letter, 0))
+
+    ws.append([_styled_cell(ws, str(name), "report header") for name in df.columns])
+
+    # A named style replaces the cell's whole style, so datetime columns need one with a date format.
+    styles = [
+        "report date" if pd.api.types.is_datetime64_any_dtype(df[name])
+        else "report text" if c == 3 and c != highlight_from
+        else "report cell"
+        for c, name in enumerate(df.columns, start=1)
+    ]
+    for row in _sheet_rows(df):
+        ws.append([_styled_cell(ws, value, style) for value, style in zip(row, styles)])
+
+    if highlight_from is not None and len(df) and len(df.columns) >= highlight_from:
+        first = f"{get_column_letter(highlight_from)}2"
+        cells = f"{first}:{get_column_letter(len(df.columns))}{len(df) + 1}"
+        ws.conditional_formatting.add(
+            cells,
+            FormulaRule(formula=[f"LEN({first})>0"], font=NOTE_FONT, fill=ABNORMAL_FILL),
+        )
+
+    return ws
+
+
+def _append_lpcd_average(ws, lpcd_df: pd.DataFrame, summary: pd.DataFrame) -> None:
+    averages = {
+        name: None if pd.isna(mean) else round(float(mean), 2)
+        for name, mean in summary["Average"].items()
+    }
+
+    ws.append([
+        _styled_cell(ws, "Average", "report average label") if c == 3 else _styled_cell(ws, averages.get(name), "report average")
+        for c, name in enumerate(lpcd_df.columns, start=1)
+    ])
+
+
+def _append_abnormal_notes(ws, rules: AbnormalRules) -> None:
+    """Acceptable / normal values below the sheet, from the same rule table, after one blank row."""
+    ws.append([])
+    for label, value in rules.notes:
+        ws.append([
+            _styled_cell(ws, label, "report note label"),
+            _styled_cell(ws, value, "report note value"),
+        ])
+
+
+# Built workbooks shared by all sessions, keyed by source content, threshold and rule version
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("JJM_EXPORT_CACHE_MAX_MB", "64")) * 1024 * 1024
+EXPORT_CACHE_TTL = int(os.environ.get("JJM_EXPORT_CACHE_TTL", "3600"))
+
+
+@st.cache_resource(show_spinner=False)
+def get_export_cache() -> ByteBudgetCache:
+    return ByteBudgetCache(EXPORT_CACHE_MAX_BYTES, EXPORT_CACHE_TTL)
+
+
+def scheme_frame_digest(scheme_df: pd.DataFrame) -> str:
+    """Content hash of a typed scheme frame (categoricals hash by value)."""
+    hashes = pd.util.hash_pandas_object(scheme_df, index=False).to_numpy()
+    return hashlib.sha256(hashes.tobytes()).hexdigest()
+
+
+def export_key(source_digest: str, report: LazyReport) -> str:
+    return f"{source_digest}:{report.threshold:g}:{report.pipeline.rules.version}"
+
+
+def report_workbook(report: LazyReport, key: str) -> bytes:
+    """
+    The report's workbook from the shared export cache; on a miss it is built from the
+    report's frames and stored, so any session asking for the same export reuses it.
+    """
+    cache = get_export_cache()
+    out_bytes = cache.get(key)
+    if out_bytes is None:
+        _, out_bytes = create_output_excel(
+            report["less_df"],
+            report["zero_df"],
+            report["today_zero_df"],
+            report["lpcd_df"],
+            report["abnormal_df"],
+            report["critical_df"],
+            report["lpcd_summary"],
+            report.pipeline.rules,
+        )
+        cache.put(key, out_bytes, len(out_bytes))
+    return out_bytes
+
+
+def output_excel_name() -> str:
+    date_str = datetime.now().strftime("%Y-%m-%d")
+    return f"ZERO & SUPPLY LESS THAN THRESHOLD SITES {date_str}.xlsx"
 
 
 def create_output_excel(
@@ -1572,26 +2550,46 @@ def create_output_excel(
     zero_df: pd.DataFrame,
     today_zero_df: pd.DataFrame,
     lpcd_df: pd.DataFrame,
-    abnormal_df: pd.DataFrame
+    abnormal_df: pd.DataFrame,
+    critical_df: pd.DataFrame,
+    lpcd_averages: pd.DataFrame | None = None,
+    rules: AbnormalRules | None = None,
 ) -> tuple[str, bytes]:
-    date_str = datetime.now().strftime("%Y-%m-%d")
-    out_name = f"ZERO & SUPPLY LESS THAN THRESHOLD SITES {date_str}.xlsx"
-
-    buffer = BytesIO()
-    with pd.ExcelWriter(buffer, engine="openpyxl") as w:
-        lpcd_df.to_excel(w, sheet_name="LPCD STATUS", index=False)
-        less_df.to_excel(w, sheet_name="SUPPLIED WATER LESS THAN 75", index=False)
-        zero_df.to_excel(w, sheet_name="ZERO(INACTIVE SITES)", index=False)
-        today_zero_df.to_excel(w, sheet_name="TODAY ZERO SITES", index=False)
-        abnormal_df.to_excel(w, sheet_name="ABNORMAL SITES", index=False)
-        critical_df = build_critical_sites(lpcd_df, abnormal_df)
-        critical_df.to_excel(w, sheet_name="CRITICAL SITES", index=False)
-
-    styled = apply_formatting(buffer.getvalue())
-    return out_name, styled
-def safe_mean(series):
-    s = pd.to_numeric(series, errors="coerce").dropna()
-    return 0 if s.empty else round(s.mean(), 1)
+    """
+    The formatted report workbook, written in one pass: every sheet is styled as its rows
+    stream out of the frames, and nothing is read back. `lpcd_averages` is the report's
+    lpcd_summary; without it the averages are taken from `lpcd_df`. `rules` is the table the
+    abnormal sheet was built with (default: ABNORMAL_RULES).
+    """
+    out_name = output_excel_name()
+    rules = rules or ABNORMAL_RULES
+    if lpcd_averages is None:
+        lpcd_averages = lpcd_summary({name: lpcd_df[name] for name in LPCD_AVERAGE_COLUMNS})
+
+    wb = Workbook(write_only=True)
+    register_report_styles(wb)
+
+    ws = write_report_sheet(wb, "LPCD STATUS", lpcd_df)
+    _append_lpcd_average(ws, lpcd_df, lpcd_averages)
+
+    write_report_sheet(wb, "SUPPLIED WATER LESS THAN 75", less_df)
+    write_report_sheet(wb, "ZERO(INACTIVE SITES)", zero_df)
+    write_report_sheet(wb, "TODAY ZERO SITES", today_zero_df)
+
+    # Abnormal value columns (D onward) are highlighted only where a value exists
+    ws = write_report_sheet(wb, "ABNORMAL SITES", abnormal_df, min_widths={"A": 34, "B": 42}, highlight_from=4)
+    _append_abnormal_notes(ws, rules)
+
+    write_report_sheet(wb, "CRITICAL SITES", critical_df)
+
+    out = BytesIO()
+    wb.save(out)
+    return out_name, out.getvalue()
+
+
+def metric_average(summary: pd.DataFrame, name: str):
+    mean = summary.at[name, "Average"]
+    return 0 if pd.isna(mean) else round(mean, 1)
 
 
 def safe_min(series):
@@ -1717,285 +2715,6 @@ def make_bar_chart(df_chart, x_col, y_col, title, color="#4F81BD", height=420):
 
 
 
-def build_site_status_summary(lpcd_df, less_df, zero_df, today_zero_df, abnormal_df, threshold):
-    base_df = lpcd_df[["Scheme Id", "Scheme Name"]].dropna().copy()
-    base_df["key"] = (
-        base_df["Scheme Id"].astype(str).str.strip() + " | " +
-        base_df["Scheme Name"].astype(str).str.strip()
-    )
-    base_df = base_df.drop_duplicates(subset=["key"]).copy()
-
-    def make_key_set(df_in):
-        if df_in.empty:
-            return set()
-        x = df_in[["Scheme Id", "Scheme Name"]].dropna().copy()
-        x["key"] = (
-            x["Scheme Id"].astype(str).str.strip() + " | " +
-            x["Scheme Name"].astype(str).str.strip()
-        )
-        return set(x["key"].tolist())
-
-    zero_keys = make_key_set(zero_df)
-    today_zero_keys = make_key_set(today_zero_df)
-    less_keys = make_key_set(less_df)
-    abnormal_keys = make_key_set(abnormal_df)
-
-    def classify_site(k):
-        if k in zero_keys:
-            return "Zero / Inactive"
-        elif k in today_zero_keys:
-            return "Today Zero"
-        elif k in less_keys:
-            return f"Supply < {threshold:g}%"
-        elif k in abnormal_keys:
-            return "Abnormal Reading"
-        else:
-            return "Healthy / Normal"
-
-    base_df["Site Status"] = base_df["key"].apply(classify_site)
-
-    status_summary = (
-        base_df["Site Status"]
-        .value_counts()
-        .rename_axis("Status")
-        .reset_index(name="Count")
-    )
-
-    return status_summary
-
-
-def build_supply_severity_summary(df: pd.DataFrame, threshold: float):
-    """
-    Build supply severity summary using ALL valid schemes from source data,
-    so that 75%-100% sites are also included in the dashboard.
-    """
-    df = flatten_columns(df)
-    norm = normalize_columns(df)
-
-    scheme_id_col = find_col_contains(norm, "schemeid")
-    scheme_name_col = find_col_contains(norm, "schemename")
-    daily_demand_col = find_col_contains(norm, "waterdemand", "meter3", "daily")
-
-    yest_prod_col = None
-    for c, cn in norm.items():
-        if ("oht" in cn) and ("watersupply" in cn) and ("meter3" in cn) and ("yesterday" in cn):
-            yest_prod_col = c
-            break
-    if yest_prod_col is None:
-        raise KeyError("Could not find 'OHT Water Supply (Meter3) Yesterday' column.")
-
-    work_df = df[[scheme_id_col, scheme_name_col, daily_demand_col, yest_prod_col]].copy()
-    work_df.columns = [
-        "Scheme Id",
-        "Scheme Name",
-        "Daily Water Demand (m^3)",
-        "Yesterday Water Production (m^3)",
-    ]
-
-    work_df["Daily Water Demand (m^3)"] = pd.to_numeric(work_df["Daily Water Demand (m^3)"], errors="coerce")
-    work_df["Yesterday Water Production (m^3)"] = pd.to_numeric(work_df["Yesterday Water Production (m^3)"], errors="coerce")
-
-    valid_scheme = (
-        work_df["Scheme Id"].notna()
-        & work_df["Scheme Name"].notna()
-        & (work_df["Scheme Id"].astype(str).str.strip().str.lower() != "none")
-        & (work_df["Scheme Name"].astype(str).str.strip().str.lower() != "none")
-        & (work_df["Scheme Id"].astype(str).str.strip() != "")
-        & (work_df["Scheme Name"].astype(str).str.strip() != "")
-    )
-
-    work_df = work_df.loc[valid_scheme].copy()
-
-    work_df["Percentage"] = (
-        work_df["Yesterday Water Production (m^3)"] / work_df["Daily Water Demand (m^3)"]
-    ) * 100
-
-    def bucket(p):
-        if pd.isna(p):
-            return "Unknown"
-        if p < 25:
-            return "<25%"
-        elif p < 50:
-            return "25–50%"
-        elif p < threshold:
-            return f"50–{threshold:g}%"
-        elif p <= 100:
-            return f"{threshold:g}–100%"
-        else:
-            return ">100%"
-
-    work_df["Severity"] = work_df["Percentage"].apply(bucket)
-
-    summary = (
-        work_df["Severity"]
-        .value_counts()
-        .rename_axis("Severity")
-        .reset_index(name="Count")
-    )
-
-    order = ["<25%", "25–50%", f"50–{threshold:g}%", f"{threshold:g}–100%", ">100%", "Unknown"]
-    summary["order"] = summary["Severity"].apply(lambda x: order.index(x) if x in order else 999)
-    summary = summary.sort_values("order").drop(columns="order").reset_index(drop=True)
-
-    return summary
-
-
-def build_abnormal_parameter_summary(abnormal_df):
-    if abnormal_df.empty:
-        return pd.DataFrame(columns=["Parameter", "Count"])
-
-    summary = pd.DataFrame({
-        "Parameter": [
-            "Hydrostatic",
-            "Chlorine",
-            "Radar Level",
-            "Pressure",
-            "Turbidity",
-            "Voltage",
-            "Weekly LPCD",
-            "Static Totalizer",
-        ],
-        "Count": [
-            abnormal_df["Abnormal Hydrostatic Level"].notna().sum(),
-            abnormal_df["Chlorine(PPM)"].notna().sum(),
-            abnormal_df["Abnormal Radar Level"].notna().sum(),
-            abnormal_df["Abnormal Pressure(BAR) Reading"].notna().sum(),
-            abnormal_df["Abnormal Turbidity (NTU)"].notna().sum(),
-            abnormal_df["Abnormal Voltage"].notna().sum(),
-            abnormal_df["Abnormal LPCD"].notna().sum(),
-            abnormal_df["Static Totalizer"].notna().sum(),
-        ]
-    })
-
-    summary = summary[summary["Count"] > 0].copy()
-    return summary
-
-
-# -------------------------------------------------------
-# NEW CRITICAL SITES BUILDER (REPLACES OLD LOGIC)
-# -------------------------------------------------------
-def build_critical_sites(lpcd_df: pd.DataFrame, abnormal_df: pd.DataFrame) -> pd.DataFrame:
-    """
-    Create CRITICAL SITES sheet using:
-    - abnormal_df for HIGH / MEDIUM / LOW sites
-    - lpcd_df for Normal sites having zero abnormal KPIs
-
-    Output columns:
-    Sr.no, Scheme Id, Scheme Name, Abnormality Count, Severity Score
-    """
-
-    output_cols = [
-        "Sr.no",
-        "Scheme Id",
-        "Scheme Name",
-        "Abnormality Count",
-        "Severity Score"
-    ]
-
-    if lpcd_df.empty:
-        return pd.DataFrame(columns=output_cols)
-
-    kpi_cols = [
-        "Static Totalizer",
-        "Abnormal Hydrostatic Level",
-        "Chlorine(PPM)",
-        "Abnormal Radar Level",
-        "Abnormal Pressure(BAR) Reading",
-        "Abnormal Turbidity (NTU)",
-        "Abnormal Voltage",
-        "Abnormal LPCD",
-    ]
-
-    critical_parts = []
-
-    # -----------------------------
-    # Abnormal sites: HIGH / MEDIUM / LOW
-    # -----------------------------
-    if not abnormal_df.empty:
-        ab_df = abnormal_df.copy()
-
-        ab_df["Abnormality Count"] = ab_df[kpi_cols].notna().sum(axis=1)
-
-        def severity(c):
-            if c >= 6:
-                return "HIGH"
-            elif c >= 3:
-                return "MEDIUM"
-            else:
-                return "LOW"
-
-        ab_df["Severity Score"] = ab_df["Abnormality Count"].apply(severity)
-
-        ab_df = ab_df[[
-            "Sr.no",
-            "Scheme Id",
-            "Scheme Name",
-            "Abnormality Count",
-            "Severity Score"
-        ]].copy()
-
-        critical_parts.append(ab_df)
-
-    # -----------------------------
-    # Normal sites: zero abnormal KPIs
-    # -----------------------------
-    base_df = lpcd_df[["Sno.", "Scheme Id", "Scheme Name"]].dropna(subset=["Scheme Id", "Scheme Name"]).copy()
-    base_df["key"] = (
-        base_df["Scheme Id"].astype(str).str.strip() + " | " +
-        base_df["Scheme Name"].astype(str).str.strip()
-    )
-
-    if abnormal_df.empty:
-        abnormal_keys = set()
-    else:
-        abnormal_keys_df = abnormal_df[["Scheme Id", "Scheme Name"]].dropna().copy()
-        abnormal_keys_df["key"] = (
-            abnormal_keys_df["Scheme Id"].astype(str).str.strip() + " | " +
-            abnormal_keys_df["Scheme Name"].astype(str).str.strip()
-        )
-        abnormal_keys = set(abnormal_keys_df["key"].tolist())
-
-    normal_df = base_df[~base_df["key"].isin(abnormal_keys)].copy()
-
-    if not normal_df.empty:
-        normal_df = normal_df.rename(columns={"Sno.": "Sr.no"})
-        normal_df["Abnormality Count"] = 0
-        normal_df["Severity Score"] = "Normal"
-
-        normal_df = normal_df[[
-            "Sr.no",
-            "Scheme Id",
-            "Scheme Name",
-            "Abnormality Count",
-            "Severity Score"
-        ]].copy()
-
-        critical_parts.append(normal_df)
-
-    if not critical_parts:
-        return pd.DataFrame(columns=output_cols)
-
-    df = pd.concat(critical_parts, ignore_index=True)
-
-    # Sorting: HIGH -> MEDIUM -> LOW -> Normal
-    severity_rank = {
-        "HIGH": 1,
-        "MEDIUM": 2,
-        "LOW": 3,
-        "Normal": 4
-    }
-
-    df["sev_rank"] = df["Severity Score"].map(severity_rank)
-    df = df.sort_values(
-        ["sev_rank", "Abnormality Count"],
-        ascending=[True, False]
-    )
-
-    df = df.drop(columns=["sev_rank"]).reset_index(drop=True)
-
-    return df
-
-
 def build_critical_summary(lpcd_df: pd.DataFrame, critical_df: pd.DataFrame) -> pd.DataFrame:
     """
     Creates severity summary for dashboard charts:
@@ -2047,41 +2766,41 @@ if "prefetched_source_name" not in st.session_state:
 if "report_data" not in st.session_state:
     st.session_state["report_data"] = None
 
+if "district_dfs" not in st.session_state:
+    st.session_state["district_dfs"] = {}
+
 
 def render_generated_report(report_data):
-    df = report_data["df"]
-    less_df = report_data["less_df"]
-    zero_df = report_data["zero_df"]
-    today_zero_df = report_data["today_zero_df"]
-    lpcd_df = report_data["lpcd_df"]
-    abnormal_df = report_data["abnormal_df"]
+    report = report_data["report"]
     out_name = report_data["out_name"]
-    out_bytes = report_data["out_bytes"]
     threshold_saved = report_data["threshold"]
     source_name = report_data.get("source_name")
 
     st.success(f"Created: {out_name}")
 
+    # Counts come from the pipeline's masks; sheets are built by whatever shows them first.
     c1, c2, c3, c4 = st.columns(4)
-    c1.metric(f"SITES < {threshold_saved:g}%", len(less_df))
-    c2.metric("ZERO/INACTIVE SITES", len(zero_df))
-    c3.metric("TODAY ZERO SITES", len(today_zero_df))
-    c4.metric("ABNORMAL SITES", len(abnormal_df))
+    c1.metric(f"SITES < {threshold_saved:g}%", report.count("less_df"))
+    c2.metric("ZERO/INACTIVE SITES", report.count("zero_df"))
+    c3.metric("TODAY ZERO SITES", report.count("today_zero_df"))
+    c4.metric("ABNORMAL SITES", report.count("abnormal_df"))
 
-    with st.expander("Preview: LPCD STATUS"):
-        st.dataframe(lpcd_df, use_container_width=True)
+    # Expander bodies run even when collapsed, so previews are opt-in.
+    if st.toggle("Show sheet previews", key="show_sheet_previews"):
+        with st.expander("Preview: LPCD STATUS"):
+            st.dataframe(report["lpcd_df"], use_container_width=True)
 
-    with st.expander("Preview: SUPPLIED WATER LESS THAN THRESHOLD"):
-        st.dataframe(less_df, use_container_width=True)
+        with st.expander("Preview: SUPPLIED WATER LESS THAN THRESHOLD"):
+            st.dataframe(report["less_df"], use_container_width=True)
 
-    with st.expander("Preview: ZERO(INACTIVE SITES)"):
-        st.dataframe(zero_df, use_container_width=True)
+        with st.expander("Preview: ZERO(INACTIVE SITES)"):
+            st.dataframe(report["zero_df"], use_container_width=True)
 
-    with st.expander("Preview: TODAY ZERO SITES"):
-        st.dataframe(today_zero_df, use_container_width=True)
+        with st.expander("Preview: TODAY ZERO SITES"):
+            st.dataframe(report["today_zero_df"], use_container_width=True)
 
-    with st.expander("Preview: ABNORMAL SITES"):
-        st.dataframe(abnormal_df, use_container_width=True)
+        with st.expander("Preview: ABNORMAL SITES"):
+            st.dataframe(report["abnormal_df"], use_container_width=True)
 
     # -------------------------------------------------------
     # OVERVIEW DASHBOARD
@@ -2091,16 +2810,9 @@ def render_generated_report(report_data):
     else:
         st.markdown("## 📊 Overview Dashboard")
 
-    status_summary = build_site_status_summary(
-        lpcd_df,
-        less_df,
-        zero_df,
-        today_zero_df,
-        abnormal_df,
-        threshold_saved
-    )
-    severity_summary = build_supply_severity_summary(df, threshold_saved)
-    abnormal_param_summary = build_abnormal_parameter_summary(abnormal_df)
+    status_summary = report["status_summary"]
+    severity_summary = report["severity_summary"]
+    abnormal_param_summary = report["abnormal_param_summary"]
 
     tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "Summary",
@@ -2121,11 +2833,11 @@ def render_generated_report(report_data):
         st.subheader("Overall Summary")
 
         c1, c2, c3, c4, c5 = st.columns(5)
-        c1.metric("Total Schemes", len(lpcd_df))
-        c2.metric(f"< {threshold_saved:g}% Supply", len(less_df))
-        c3.metric("Zero / Inactive", len(zero_df))
-        c4.metric("Today Zero", len(today_zero_df))
-        c5.metric("Abnormal", len(abnormal_df))
+        c1.metric("Total Schemes", report.count("lpcd_df"))
+        c2.metric(f"< {threshold_saved:g}% Supply", report.count("less_df"))
+        c3.metric("Zero / Inactive", report.count("zero_df"))
+        c4.metric("Today Zero", report.count("today_zero_df"))
+        c5.metric("Abnormal", report.count("abnormal_df"))
 
         st.markdown("### ✅ Site Status")
         col_status_1, col_status_2 = st.columns(2)
@@ -2193,13 +2905,13 @@ def render_generated_report(report_data):
         st.markdown("### ✅ Supply Severity")
         col_sup_1, col_sup_2 = st.columns(2)
 
+        *below_labels, full_label, over_label, unknown_label = severity_labels(threshold_saved)
+        below_colors = ["#FF4B4B", "#F4A261", "#FFD166"]
         supply_color_map = {
-            "<25%": "#FF4B4B",
-            "25–50%": "#F4A261",
-            f"50–{threshold_saved:g}%": "#FFD166",
-            f"{threshold_saved:g}–100%": "#66C2A5",
-            ">100%": "#8DA0CB",
-            "Unknown": "#BDBDBD"
+            **{label: below_colors[max(0, i - len(below_labels) + 3)] for i, label in enumerate(below_labels)},
+            full_label: "#66C2A5",
+            over_label: "#8DA0CB",
+            unknown_label: "#BDBDBD"
         }
 
         with col_sup_1:
@@ -2254,6 +2966,26 @@ def render_generated_report(report_data):
 
                 st.plotly_chart(fig_supply_bar, use_container_width=True)
 
+        curve = threshold_curve(report.pipeline.sweep, THRESHOLD_CURVE_POINTS)
+        fig_curve = px.line(curve, x="Threshold (%)", y="Sites", title="Sites Below Threshold", markers=True)
+        fig_curve.add_vline(x=threshold_saved, line_dash="dash", line_color=chart_text_color)
+        fig_curve.update_layout(
+            **get_plotly_theme(),
+            height=360,
+            margin=dict(l=10, r=10, t=50, b=10)
+        )
+        fig_curve.update_xaxes(
+            tickfont=dict(color=chart_text_color, size=11),
+            title_font=dict(color=chart_text_color),
+            gridcolor=grid_color
+        )
+        fig_curve.update_yaxes(
+            tickfont=dict(color=chart_text_color, size=11),
+            title_font=dict(color=chart_text_color),
+            gridcolor=grid_color
+        )
+        st.plotly_chart(fig_curve, use_container_width=True)
+
         st.markdown("### ✅ Abnormal Parameters")
         col_abn_1, col_abn_2 = st.columns(2)
 
@@ -2325,15 +3057,17 @@ def render_generated_report(report_data):
     # -------------------------------------------------------
     with tab2:
         st.subheader("LPCD Status Overview")
+        lpcd_df = report["lpcd_df"]
+        lpcd_averages = report["lpcd_summary"]
 
         c1, c2, c3 = st.columns(3)
-        c1.metric("Avg Yesterday LPCD", safe_mean(lpcd_df["Avg LPCD (Yesterday)"]))
-        c2.metric("Avg Weekly LPCD", safe_mean(lpcd_df["Avg LPCD (Weekly)"]))
-        c3.metric("Avg Monthly LPCD", safe_mean(lpcd_df["Avg LPCD (Monthly)"]))
+        c1.metric("Avg Yesterday LPCD", metric_average(lpcd_averages, "Avg LPCD (Yesterday)"))
+        c2.metric("Avg Weekly LPCD", metric_average(lpcd_averages, "Avg LPCD (Weekly)"))
+        c3.metric("Avg Monthly LPCD", metric_average(lpcd_averages, "Avg LPCD (Monthly)"))
 
         st.markdown("### 🔽 Lowest LPCD Weekly (Top 10)")
 
-        top10_lpcd = lpcd_df[["Scheme Name", "Avg LPCD (Weekly)"]].copy()
+        top10_lpcd = lpcd_df[["Scheme Name", "Avg LPCD (Weekly)"]]
         top10_lpcd["Avg LPCD (Weekly)"] = pd.to_numeric(
             top10_lpcd["Avg LPCD (Weekly)"], errors="coerce"
         )
@@ -2396,6 +3130,7 @@ def render_generated_report(report_data):
     # -------------------------------------------------------
     with tab3:
         st.subheader("Sites Supplied Below Threshold")
+        less_df = report["less_df"]
 
         c1, c2 = st.columns(2)
         c1.metric("Below Threshold Sites", len(less_df))
@@ -2410,6 +3145,7 @@ def render_generated_report(report_data):
     # -------------------------------------------------------
     with tab4:
         st.subheader("Zero / Inactive Sites")
+        zero_df = report["zero_df"]
 
         st.metric("Total Inactive Sites", len(zero_df))
         st.dataframe(zero_df, use_container_width=True)
@@ -2419,6 +3155,7 @@ def render_generated_report(report_data):
     # -------------------------------------------------------
     with tab5:
         st.subheader("Abnormal Instrument Readings")
+        abnormal_df = report["abnormal_df"]
 
         st.metric("Total Abnormal Sites", len(abnormal_df))
 
@@ -2495,7 +3232,7 @@ def render_generated_report(report_data):
     with tab6:
         st.subheader("🚨 Critical Sites (Based on 8 KPIs)")
 
-        critical_df = build_critical_sites(lpcd_df, abnormal_df)
+        critical_df = report["critical_df"]
         critical_summary = build_critical_summary(lpcd_df, critical_df)
 
         sev_order = ["HIGH", "MEDIUM", "LOW", "Normal"]
@@ -2587,46 +3324,68 @@ def render_generated_report(report_data):
         st.markdown("### 📄 Detailed Critical Sites Table")
         st.dataframe(critical_df, use_container_width=True)
 
-    st.download_button(
-        "⬇️ Download Excel Report",
-        data=out_bytes,
-        file_name=out_name,
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
+    # The workbook is the costliest access to the report: it is built on request and kept
+    # in the shared export cache, not in the session.
+    export = export_key(report_data["source_digest"], report)
+    out_bytes = get_export_cache().get(export)
+    if out_bytes is None and st.button(f"Build Excel Report ({threshold_saved:g}%)", type="secondary"):
+        out_bytes = report_workbook(report, export)
+
+    if out_bytes is not None:
+        st.download_button(
+            "⬇️ Download Excel Report",
+            data=out_bytes,
+            file_name=out_name,
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
 
 
 st.markdown("### Quick District Load")
-col_d1, col_d2, col_d3 = st.columns(3)
-
-if col_d1.button("AYODHYA", type="secondary"):
-    try:
-        st.session_state["prefetched_df"] = read_source_from_url(DISTRICT_URLS["AYODHYA"])
-        st.session_state["prefetched_source_name"] = "AYODHYA"
-        st.session_state["report_data"] = None
-        st.success("AYODHYA data loaded successfully. Now click Generate Report.")
-    except Exception as e:
-        st.error("Could not load AYODHYA data from JJM portal.")
+district_cols = st.columns(len(DISTRICT_URLS) + 1)
+
+for col_d, district in zip(district_cols, DISTRICT_URLS):
+    if col_d.button(district, type="secondary"):
+        try:
+            district_df = read_source_from_url(DISTRICT_URLS[district])
+            st.session_state["district_dfs"][district] = district_df
+            st.session_state["prefetched_df"] = district_df
+            st.session_state["prefetched_source_name"] = district
+            st.session_state["report_data"] = None
+            st.success(f"{district} data loaded successfully. Now click Generate Report.")
+        except Exception as e:
+            st.error(f"Could not load {district} data from JJM portal.")
+            st.exception(e)
+
+if district_cols[-1].button("ALL DISTRICTS", type="secondary"):
+    frames, errors = read_all_districts()
+    st.session_state["district_dfs"].update(frames)
+
+    for district, e in errors.items():
+        st.error(f"Could not load {district} data from JJM portal.")
         st.exception(e)
 
-if col_d2.button("SULTANPUR", type="secondary"):
-    try:
-        st.session_state["prefetched_df"] = read_source_from_url(DISTRICT_URLS["SULTANPUR"])
-        st.session_state["prefetched_source_name"] = "SULTANPUR"
+    if frames:
+        first = next(iter(frames))
+        st.session_state["prefetched_df"] = frames[first]
+        st.session_state["prefetched_source_name"] = first
         st.session_state["report_data"] = None
-        st.success("SULTANPUR data loaded successfully. Now click Generate Report.")
-    except Exception as e:
-        st.error("Could not load SULTANPUR data from JJM portal.")
-        st.exception(e)
+        st.success(
+            f"Loaded {len(frames)} districts: {', '.join(frames)}. "
+            "Pick one below and click Generate Report."
+        )
 
-if col_d3.button("DEORIA", type="secondary"):
-    try:
-        st.session_state["prefetched_df"] = read_source_from_url(DISTRICT_URLS["DEORIA"])
-        st.session_state["prefetched_source_name"] = "DEORIA"
+if len(st.session_state["district_dfs"]) > 1:
+    loaded_names = list(st.session_state["district_dfs"])
+    current_name = st.session_state["prefetched_source_name"]
+    picked = st.selectbox(
+        "Loaded districts",
+        loaded_names,
+        index=loaded_names.index(current_name) if current_name in loaded_names else 0,
+    )
+    if picked != current_name:
+        st.session_state["prefetched_df"] = st.session_state["district_dfs"][picked]
+        st.session_state["prefetched_source_name"] = picked
         st.session_state["report_data"] = None
-        st.success("DEORIA data loaded successfully. Now click Generate Report.")
-    except Exception as e:
-        st.error("Could not load DEORIA data from JJM portal.")
-        st.exception(e)
 
 if uploaded is not None:
     st.info(f"Uploaded: {uploaded.name}")
@@ -2641,29 +3400,18 @@ if st.button("Generate Report", type="primary"):
             df = read_source(uploaded)
             source_name = None
         elif st.session_state["prefetched_df"] is not None:
-            df = st.session_state["prefetched_df"].copy()
+            df = st.session_state["prefetched_df"]
             source_name = st.session_state.get("prefetched_source_name")
         else:
             st.warning("Please upload the JJMUP export file or click a district button first.")
             st.stop()
 
-        less_df, zero_df, today_zero_df = build_report(df, threshold=threshold)
-        lpcd_df = build_lpcd_status(df)
-        abnormal_df = build_abnormal_sites(df)
-
-        out_name, out_bytes = create_output_excel(
-            less_df, zero_df, today_zero_df, lpcd_df, abnormal_df
-        )
+        scheme_df = build_scheme_frame(df)
 
         st.session_state["report_data"] = {
-            "df": df,
-            "less_df": less_df,
-            "zero_df": zero_df,
-            "today_zero_df": today_zero_df,
-            "lpcd_df": lpcd_df,
-            "abnormal_df": abnormal_df,
-            "out_name": out_name,
-            "out_bytes": out_bytes,
+            "report": LazyReport(ReportPipeline(scheme_df, threshold)),
+            "source_digest": scheme_frame_digest(scheme_df),
+            "out_name": output_excel_name(),
             "threshold": threshold,
             "source_name": source_name,
         }
@@ -2672,5 +3420,36 @@ if st.button("Generate Report", type="primary"):
         st.error("Error while generating report. Please check the uploaded file format/columns.")
         st.exception(e)
 
+report_data = st.session_state["report_data"]
+if report_data is not None and report_data.get("source_name") in DISTRICT_URLS:
+    district = report_data["source_name"]
+    if st.button(f"Refresh {district}", type="secondary"):
+        try:
+            # The page is revalidated with the portal; an unchanged page comes back from the parse cache.
+            district_df = read_source_from_url(DISTRICT_URLS[district], max_age=0)
+            scheme_df = build_scheme_frame(district_df)
+
+            st.session_state["district_dfs"][district] = district_df
+            st.session_state["prefetched_df"] = district_df
+            st.session_state["report_data"] = {
+                **report_data,
+                "report": LazyReport(ReportPipeline(scheme_df, threshold)),
+                "source_digest": scheme_frame_digest(scheme_df),
+                "out_name": output_excel_name(),
+                "threshold": threshold,
+            }
+            st.success(f"{district} refreshed: {len(scheme_df)} schemes.")
+        except Exception as e:
+            st.error(f"Could not refresh {district} data from JJM portal.")
+            st.exception(e)
+
+report_data = st.session_state["report_data"]
+if report_data is not None and report_data["threshold"] != threshold:
+    st.session_state["report_data"] = {
+        **report_data,
+        "report": report_data["report"].retarget(threshold),
+        "threshold": threshold,
+    }
+
 if st.session_state["report_data"] is not None:
     render_generated_report(st.session_state["report_data"])
@@ -0,0 +1,507 @@
+"""
+Benchmarks for the report pipeline on synthetic JJMUP exports.
+
+    python benchmark.py xlsx --schemes 20000
+
+Importing app runs the Streamlit script in bare mode; its widgets render nowhere.
+"""
+import argparse
+import logging
+import sys
+import time
+import tracemalloc
+import warnings
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Silence Streamlit's bare-mode warnings triggered by importing the app script.
+logging.disable(logging.WARNING)
+warnings.filterwarnings("ignore")
+
+import app  # noqa: E402
+
+
+EXTRA_COLUMNS = 19
+
+
+def make_export(n_schemes: int, seed: int = 0) -> pd.DataFrame:
+    """A portal-shaped export: the 21 columns the report reads plus filler columns."""
+    rng = np.random.default_rng(seed)
+
+    def kpi(lo, hi, blank=0.1, zero=0.05):
+        v = rng.uniform(lo, hi, n_schemes).round(2)
+        v[rng.random(n_schemes) < zero] = 0
+        v[rng.random(n_schemes) < blank] = np.nan
+        return v
+
+    data = {
+        "Sno.": np.arange(1, n_schemes + 1),
+        "Scheme Id": 100000 + np.arange(n_schemes),
+        "Scheme Name": [f"Scheme {i} Gram Panchayat" for i in range(n_schemes)],
+        "District": "AYODHYA",
+        "Block": [f"Block {i % 17}" for i in range(n_schemes)],
+        "Daily Water Demand (Meter3)": kpi(50, 400, 0.02, 0.01),
+        "OHT Water Supply (Meter3) Yesterday": kpi(0, 450),
+        "Today Water Production (Meter3)": kpi(0, 300, 0.1, 0.2),
+        "Yesterday Water Production (Meter3)": kpi(0, 300),
+        "Overall Production Water (Meter3)": kpi(1000, 90000),
+        "Ground Water Depth Avg (Meter)": kpi(10, 30),
+        "Chlorine (PPM)": kpi(0, 0.8),
+        "Pressure (Bar)": kpi(0, 2.5),
+        "Turbidity (NTU)": kpi(-1, 8),
+        "Voltage RN": kpi(180, 260),
+        "Pump Status": rng.choice(["ON", "OFF", "NA"], n_schemes),
+        "OHT Level (Value in M)": kpi(-1, 9),
+        "Avg LPCD (Yesterday)": kpi(10, 120),
+        "Avg LPCD (Weekly)": kpi(10, 120),
+        "Avg LPCD (Monthly)": kpi(10, 120),
+        "Last Data Receive Date": [f"{1 + i % 28:02d}-10-2026 {i % 24:02d}:15:00" for i in range(n_schemes)],
+    }
+    for i in range(EXTRA_COLUMNS):
+        data[f"Extra Field {i}"] = rng.integers(0, 1000, n_schemes)
+
+    return pd.DataFrame(data)
+
+
+def timed(fn, *args, repeat: int = 3, **kwargs) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+# Arrow buffers keep a pointer to the pool that allocated them, so every proxy pool stays alive.
+ARROW_POOLS = []
+
+
+def traced_peak(fn, *args, **kwargs) -> int:
+    """
+    Peak bytes allocated while fn runs: tracemalloc's peak (Python objects and numpy buffers)
+    plus the peak of pyarrow's memory pool, which tracemalloc does not see (Arrow strings under
+    pandas 3). The two peaks are added, so this is an upper bound.
+    """
+    default_pool = pa.default_memory_pool()
+    pool = pa.proxy_memory_pool(default_pool)
+    ARROW_POOLS.append(pool)
+    pa.set_memory_pool(pool)
+    tracemalloc.start()
+    try:
+        fn(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1] + pool.max_memory()
+    finally:
+        tracemalloc.stop()
+        pa.set_memory_pool(default_pool)
+
+
+def report(title: str, rows: list[tuple[str, float]]) -> None:
+    print(title)
+    base = rows[0][1]
+    for label, secs in rows:
+        print(f"  {label:<28} {secs * 1000:10.1f} ms   x{base / secs:5.2f}")
+
+
+def bench_xlsx(args) -> None:
+    buffer = BytesIO()
+    make_export(args.schemes).to_excel(buffer, index=False)
+    raw = buffer.getvalue()
+
+    rows = [("openpyxl (full sheet)", timed(app.read_xlsx, raw, "openpyxl", repeat=args.repeat))]
+    try:
+        rows.append(("calamine (report columns)", timed(app.read_xlsx, raw, "calamine", repeat=args.repeat)))
+    except ImportError as e:
+        print(f"calamine skipped: {e}")
+
+    report(f".xlsx read, {args.schemes} schemes", rows)
+
+
+def bench_rules(args) -> None:
+    """Abnormal rule evaluation as the table grows: the shipped rules repeated under new column names."""
+    sf = app.build_scheme_frame(app.project_report_columns(make_export(args.schemes)))
+    base = app.ABNORMAL_RULES.rules
+
+    rows = []
+    for copies in (1, 4, 16):
+        rules = [dict(rule, column=f"{rule['column']} #{i}") for i in range(copies) for rule in base]
+        table = app.AbnormalRules(rules, version="bench")
+        rows.append((f"{len(rules)} rules", timed(table.evaluate, sf, repeat=args.repeat)))
+
+    report(f"Abnormal rule evaluation, {args.schemes} schemes", rows)
+
+
+def string_key_joins(frames: dict, threshold: float) -> None:
+    """Site status and Normal critical sites joined on "Scheme Id | Scheme Name" strings."""
+    def keys(df_in):
+        x = df_in[["Scheme Id", "Scheme Name"]].dropna()
+        return x["Scheme Id"].astype(str).str.strip() + " | " + x["Scheme Name"].astype(str).str.strip()
+
+    base = keys(frames["lpcd_df"])
+    sites = base.drop_duplicates()
+    zero, today_zero, less, abnormal = (
+        set(keys(frames[name])) for name in ("zero_df", "today_zero_df", "less_df", "abnormal_df")
+    )
+
+    def classify(k):
+        if k in zero:
+            return "Zero / Inactive"
+        if k in today_zero:
+            return "Today Zero"
+        if k in less:
+            return f"Supply < {threshold:g}%"
+        if k in abnormal:
+            return "Abnormal Reading"
+        return "Healthy / Normal"
+
+    sites.apply(classify)
+    base[~base.isin(abnormal)]
+
+
+def legacy_supply_sheets(df: pd.DataFrame, threshold: float):
+    """The former build_report: less, zero and today-zero sheets from their own working frame."""
+    sf = app.build_scheme_frame(df)
+    work = pd.DataFrame({
+        "Scheme Id": sf["scheme_id"],
+        "Scheme Name": sf["scheme_name"],
+        "Daily Water Demand (m^3)": sf["daily_demand"],
+        "Yesterday Water Production (m^3)": sf["yest_supply"],
+        "Today Water Production (m^3)": sf["today_prod"],
+    })
+    work["Percentage"] = work["Yesterday Water Production (m^3)"] / work["Daily Water Demand (m^3)"] * 100
+
+    less_df = work[work["Percentage"].fillna(0) < threshold].copy()
+    less_df["Supplied Water Percentage"] = f"<{threshold:g}%"
+    less_df.insert(0, "SR.No.", range(1, len(less_df) + 1))
+    less_df = less_df.drop(columns=["Today Water Production (m^3)"])
+
+    yest, today = work["Yesterday Water Production (m^3)"], work["Today Water Production (m^3)"]
+    zero_mask = sf["valid_scheme"] & ~(yest.isna() & today.isna()) & (yest.fillna(0) == 0) & (today.fillna(0) == 0)
+    zero_df = work.loc[zero_mask, ["Scheme Id", "Scheme Name", "Yesterday Water Production (m^3)",
+                                   "Today Water Production (m^3)"]].copy()
+    zero_df["Last Data Receive Date"] = sf.loc[zero_mask, "last_data_date"]
+    zero_df["Site Status"] = "ZERO/INACTIVE SITE"
+    zero_df.insert(0, "SR.No.", range(1, len(zero_df) + 1))
+
+    today_mask = sf["valid_scheme"] & (today.fillna(0) == 0)
+    today_zero_df = work.loc[today_mask, ["Scheme Id", "Scheme Name", "Today Water Production (m^3)"]].copy()
+    today_zero_df["Last Data Receive Date"] = sf.loc[today_mask, "last_data_date"]
+    today_zero_df["Site Status"] = "ZERO/INACTIVE SITE"
+    today_zero_df.insert(0, "SR.No.", range(1, len(today_zero_df) + 1))
+    return less_df, zero_df, today_zero_df
+
+
+def legacy_lpcd_status(df: pd.DataFrame) -> pd.DataFrame:
+    sf = app.build_scheme_frame(df)
+    return pd.DataFrame({
+        "Sno.": sf["sno"],
+        "Scheme Id": sf["scheme_id"],
+        "Scheme Name": sf["scheme_name"],
+        "Avg LPCD (Yesterday)": sf["lpcd_yesterday"],
+        "Avg LPCD (Weekly)": sf["lpcd_weekly"],
+        "Avg LPCD (Monthly)": sf["lpcd_monthly"],
+    })
+
+
+LEGACY_KPI_COLUMNS = {
+    "Abnormal Hydrostatic Level": "hydro",
+    "Chlorine(PPM)": "chlorine",
+    "Abnormal Radar Level": "radar",
+    "Abnormal Pressure(BAR) Reading": "pressure",
+    "Abnormal Turbidity (NTU)": "turbidity",
+    "Abnormal Voltage": "voltage",
+    "Abnormal LPCD": "lpcd_weekly",
+    "Static Totalizer": "overall_prod",
+}
+
+
+def legacy_abnormal_sites(df: pd.DataFrame) -> pd.DataFrame:
+    """The former build_abnormal_sites: hard-coded rules, normal values blanked with .loc."""
+    sf = app.build_scheme_frame(df)
+    ab = pd.DataFrame({"Sr.no": sf["sno"], "Scheme Id": sf["scheme_id"], "Scheme Name": sf["scheme_name"],
+                       **{label: sf[field] for label, field in LEGACY_KPI_COLUMNS.items()}})
+    v = {label: ab[label] for label in LEGACY_KPI_COLUMNS}
+    pump, today, yest = sf["pump_status"], sf["today_prod"], sf["yest_supply"]
+
+    pressure = v["Abnormal Pressure(BAR) Reading"]
+    pressure_abnormal = pd.Series(False, index=ab.index)
+    on, off = pressure.notna() & (pump == "ON"), pressure.notna() & (pump == "OFF")
+    pressure_abnormal.loc[on] = ~pressure.loc[on].between(1.45, 1.95)
+    pressure_abnormal.loc[off] = ~(pressure.loc[off] == 0)
+    pressure_abnormal.loc[pressure.notna() & ~pump.isin(["ON", "OFF"])] = True
+
+    radar, turbidity, voltage = v["Abnormal Radar Level"], v["Abnormal Turbidity (NTU)"], v["Abnormal Voltage"]
+    abnormal = {
+        "Abnormal Hydrostatic Level": ~v["Abnormal Hydrostatic Level"].between(15, 22.5),
+        "Chlorine(PPM)": ~v["Chlorine(PPM)"].between(0.15, 0.5),
+        "Abnormal Radar Level": ~((radar > 0) & (radar <= 6.5)),
+        "Abnormal Pressure(BAR) Reading": pressure_abnormal,
+        "Abnormal Turbidity (NTU)": ~((turbidity >= 0) & (turbidity <= 5)),
+        "Abnormal Voltage": (voltage <= 0) | (voltage < 215) | (voltage > 240),
+        "Abnormal LPCD": v["Abnormal LPCD"] < 55,
+        "Static Totalizer": today.notna() & yest.notna() & (today == 0) & (yest == 0),
+    }
+    for label, mask in abnormal.items():
+        ab.loc[~(v[label].notna() & mask), label] = pd.NA
+
+    keep = ab[list(LEGACY_KPI_COLUMNS)].notna().any(axis=1)
+    ab = ab.loc[keep].copy()
+    ab.reset_index(drop=True, inplace=True)
+    return ab
+
+
+def legacy_severity_summary(df: pd.DataFrame, threshold: float) -> pd.DataFrame:
+    """The former build_supply_severity_summary: one Python bucket() call per scheme."""
+    sf = app.build_scheme_frame(df)
+    sf = sf.loc[sf["valid_scheme"]]
+    pct = sf["yest_supply"] / sf["daily_demand"] * 100
+
+    def bucket(p):
+        if pd.isna(p):
+            return "Unknown"
+        if p < 25:
+            return "<25%"
+        if p < 50:
+            return "25–50%"
+        if p < threshold:
+            return f"50–{threshold:g}%"
+        return f"{threshold:g}–100%" if p <= 100 else ">100%"
+
+    return pct.apply(bucket).value_counts().rename_axis("Severity").reset_index(name="Count")
+
+
+def legacy_critical_sites(lpcd_df: pd.DataFrame, abnormal_df: pd.DataFrame) -> pd.DataFrame:
+    """The former build_critical_sites: severity by apply, Normal sites by string-key exclusion."""
+    cols = ["Sr.no", "Scheme Id", "Scheme Name", "Abnormality Count", "Severity Score"]
+    ab = abnormal_df.copy()
+    ab["Abnormality Count"] = ab[list(LEGACY_KPI_COLUMNS)].notna().sum(axis=1)
+    ab["Severity Score"] = ab["Abnormality Count"].apply(lambda c: "HIGH" if c >= 6 else "MEDIUM" if c >= 3 else "LOW")
+
+    def keys(df_in):
+        return df_in["Scheme Id"].astype(str).str.strip() + " | " + df_in["Scheme Name"].astype(str).str.strip()
+
+    base = lpcd_df[["Sno.", "Scheme Id", "Scheme Name"]].dropna(subset=["Scheme Id", "Scheme Name"]).copy()
+    normal = base[~keys(base).isin(set(keys(abnormal_df[["Scheme Id", "Scheme Name"]].dropna())))].copy()
+    normal = normal.rename(columns={"Sno.": "Sr.no"})
+    normal["Abnormality Count"] = 0
+    normal["Severity Score"] = "Normal"
+
+    out = pd.concat([ab[cols], normal[cols]], ignore_index=True)
+    out["sev_rank"] = out["Severity Score"].map({"HIGH": 1, "MEDIUM": 2, "LOW": 3, "Normal": 4})
+    return out.sort_values(["sev_rank", "Abnormality Count"], ascending=[True, False]).drop(columns="sev_rank")
+
+
+def builders_path(df: pd.DataFrame, threshold: float) -> None:
+    """The former separate builders: each one re-types the raw source frame and re-derives its masks."""
+    less_df, zero_df, today_zero_df = legacy_supply_sheets(df, threshold)
+    lpcd_df = legacy_lpcd_status(df)
+    abnormal_df = legacy_abnormal_sites(df)
+    legacy_severity_summary(df, threshold)
+    string_key_joins({"lpcd_df": lpcd_df, "less_df": less_df, "zero_df": zero_df,
+                      "today_zero_df": today_zero_df, "abnormal_df": abnormal_df}, threshold)
+    legacy_critical_sites(lpcd_df, abnormal_df)
+
+
+def pipeline_path(df: pd.DataFrame, threshold: float) -> None:
+    app.ReportPipeline(app.build_scheme_frame(df), threshold).frames()
+
+
+def bench_pipeline(args) -> None:
+    df = app.project_report_columns(make_export(args.schemes))
+    report(f"All sheets and summaries, {args.schemes} schemes", [
+        ("separate builders", timed(builders_path, df, 75.0, repeat=args.repeat)),
+        ("ReportPipeline", timed(pipeline_path, df, 75.0, repeat=args.repeat)),
+    ])
+
+
+def site_key_joins(pipeline: "app.ReportPipeline") -> None:
+    """Site status and CRITICAL SITES as the report builds them, from the pipeline's site keys."""
+    pipeline.site_status_df()
+    pipeline.critical_df()
+
+
+def bench_keys(args) -> None:
+    pipeline = app.ReportPipeline(app.build_scheme_frame(make_export(args.schemes)), 75.0)
+    frames = pipeline.frames()
+    report(f"Site status and critical-site joins, {args.schemes} schemes", [
+        ("string keys", timed(string_key_joins, frames, 75.0, repeat=args.repeat)),
+        ("ReportPipeline site keys", timed(site_key_joins, pipeline, repeat=args.repeat)),
+    ])
+
+
+def full_rebuild(sf: pd.DataFrame, threshold: float) -> None:
+    app.ReportPipeline(sf, threshold).frames()
+
+
+def retarget_path(lazy: "app.LazyReport", threshold: float) -> None:
+    dict(lazy.retarget(threshold))
+
+
+def bench_threshold(args) -> None:
+    """A threshold change: rebuilding every frame vs re-slicing the presorted percentages."""
+    sf = app.build_scheme_frame(make_export(args.schemes))
+    lazy = app.LazyReport(app.ReportPipeline(sf, 75.0))
+    dict(lazy)
+    report(f"Threshold change 75% -> 60%, {args.schemes} schemes", [
+        ("full rebuild", timed(full_rebuild, sf, 60.0, repeat=args.repeat)),
+        ("retarget", timed(retarget_path, lazy, 60.0, repeat=args.repeat)),
+        ("curve (19 thresholds)", timed(app.threshold_curve, lazy.pipeline.sweep, app.THRESHOLD_CURVE_POINTS, repeat=args.repeat)),
+    ])
+
+
+def eager_generate(sf: pd.DataFrame, threshold: float) -> None:
+    """Generate as it was: every frame and the workbook before the first metric."""
+    frames = app.ReportPipeline(sf, threshold).frames()
+    app.create_output_excel(*(frames[name] for name in ("less_df", "zero_df", "today_zero_df", "lpcd_df", "abnormal_df", "critical_df")))
+
+
+def lazy_generate(sf: pd.DataFrame, threshold: float) -> None:
+    lazy = app.LazyReport(app.ReportPipeline(sf, threshold))
+    [lazy.count(name) for name in app.REPORT_FRAME_KEYS]
+
+
+def bench_first_metric(args) -> None:
+    sf = app.build_scheme_frame(make_export(args.schemes))
+    report(f"Generate to first metric, {args.schemes} schemes", [
+        ("eager frames + workbook", timed(eager_generate, sf, 75.0, repeat=args.repeat)),
+        ("lazy report counts", timed(lazy_generate, sf, 75.0, repeat=args.repeat)),
+    ])
+
+
+def generate_all(df: pd.DataFrame, threshold: float) -> dict:
+    """Typed scheme frame and every sheet and summary, as a fully browsed report holds them."""
+    return dict(app.LazyReport(app.ReportPipeline(app.build_scheme_frame(df), threshold)))
+
+
+# Allowed peak as a multiple of the source frame, by pandas major version. pandas 3 stores the
+# source text as Arrow strings, about half the bytes of pandas 2's object strings, while the report
+# frames cost about the same; its category conversion also hashes the text in Arrow.
+MEMORY_BUDGETS = {2: 3.0, 3: 6.0}
+
+
+def bench_memory(args) -> None:
+    """
+    Peak allocations (numpy and Arrow buffers included) of every report frame, as a multiple of
+    the projected source frame's memory_usage(deep=True); exits non-zero above the budget. The
+    workbook is left out: its openpyxl cell objects dwarf the frames.
+    """
+    pandas_major = int(pd.__version__.split(".")[0])
+    budget = args.budget or MEMORY_BUDGETS.get(pandas_major, max(MEMORY_BUDGETS.values()))
+    df = app.project_report_columns(make_export(args.schemes))
+    source_bytes = int(df.memory_usage(deep=True).sum())
+    generate_all(df.head(50), 75.0)  # warm imports and caches outside the trace
+
+    peak = traced_peak(generate_all, df, 75.0)
+    ratio = peak / source_bytes
+    print(f"Peak memory, {args.schemes} schemes, pandas {pd.__version__}")
+    print(f"  source frame {source_bytes / 2**20:8.1f} MiB")
+    print(f"  peak         {peak / 2**20:8.1f} MiB   x{ratio:5.2f} (budget x{budget:g})")
+    if ratio > budget:
+        sys.exit(f"peak memory x{ratio:.2f} of the source exceeds the budget x{budget:g}")
+
+
+def ingest_and_report(raw: bytes, dtype_backend: str) -> None:
+    df = app.apply_dtype_backend(app.project_report_columns(app.read_xlsx(raw, "openpyxl", dtype_backend)), dtype_backend)
+    app.ReportPipeline(app.build_scheme_frame(df), 75.0).frames()
+
+
+def bench_backend(args) -> None:
+    """The .xlsx read, typed scheme frame and every report frame with numpy vs Arrow-backed dtypes."""
+    buffer = BytesIO()
+    make_export(args.schemes).to_excel(buffer, index=False)
+    raw = buffer.getvalue()
+
+    rows = []
+    for backend in ("numpy", "pyarrow"):
+        df = app.project_report_columns(app.read_xlsx(raw, "openpyxl", backend))
+        rows.append((f"{backend}: scheme frame", timed(app.build_scheme_frame, df, repeat=args.repeat)))
+        rows.append((f"{backend}: read + report", timed(ingest_and_report, raw, backend, repeat=args.repeat)))
+
+    report(f"Dtype backends, {args.schemes} schemes", rows)
+
+
+EXPORT_SHEETS = ["less_df", "zero_df", "today_zero_df", "lpcd_df", "abnormal_df", "critical_df"]
+
+
+def roundtrip_export(less_df, zero_df, today_zero_df, lpcd_df, abnormal_df, critical_df) -> bytes:
+    """The former export: pandas writes the sheets, openpyxl reloads them and restyles every cell."""
+    from openpyxl import load_workbook
+
+    buffer = BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as w:
+        for name, df in [("LPCD STATUS", lpcd_df), ("SUPPLIED WATER LESS THAN 75", less_df),
+                         ("ZERO(INACTIVE SITES)", zero_df), ("TODAY ZERO SITES", today_zero_df),
+                         ("ABNORMAL SITES", abnormal_df), ("CRITICAL SITES", critical_df)]:
+            df.to_excel(w, sheet_name=name, index=False)
+
+    wb = load_workbook(BytesIO(buffer.getvalue()))
+    for ws in wb.worksheets:
+        maxlen = {}
+        for row in ws.iter_rows(min_row=1, max_row=ws.max_row, max_col=ws.max_column):
+            for cell in row:
+                cell.border = app.BORDER_ALL
+                cell.alignment = app.ALIGN_LEFT if cell.column == 3 else app.ALIGN_CENTER
+                maxlen[cell.column] = max(maxlen.get(cell.column, 0), len("" if cell.value is None else str(cell.value)))
+        for c, width in maxlen.items():
+            ws.column_dimensions[app.get_column_letter(c)].width = max(10, min(60, int(width * 1.2) + 2))
+
+    out = BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def bench_export(args) -> None:
+    frames = app.ReportPipeline(app.build_scheme_frame(make_export(args.schemes)), 75.0).frames()
+    sheets = [frames[name] for name in EXPORT_SHEETS]
+
+    rows = [
+        ("write + reload + restyle", timed(roundtrip_export, *sheets, repeat=args.repeat)),
+        ("single-pass writer", timed(app.create_output_excel, *sheets, repeat=args.repeat)),
+    ]
+    report(f"Excel export, {args.schemes} schemes", rows)
+    print(f"  peak memory: roundtrip {traced_peak(roundtrip_export, *sheets) / 2**20:.1f} MiB, "
+          f"single pass {traced_peak(app.create_output_excel, *sheets) / 2**20:.1f} MiB")
+    check_date_formats(app.create_output_excel(*sheets)[1])
+
+
+def check_date_formats(workbook: bytes) -> None:
+    """Exit non-zero unless every Last Data Receive Date cell carries the report's date format."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(BytesIO(workbook), read_only=True)
+    for title in ("ZERO(INACTIVE SITES)", "TODAY ZERO SITES"):
+        rows = wb[title].iter_rows()
+        column = [cell.value for cell in next(rows)].index("Last Data Receive Date")
+        formats = {row[column].number_format for row in rows if row[column].value is not None}
+        if formats - {app.REPORT_DATE_FORMAT}:
+            sys.exit(f"{title}: Last Data Receive Date exported as {sorted(formats)}, expected {app.REPORT_DATE_FORMAT!r}")
+    print(f"  date format: {app.REPORT_DATE_FORMAT}")
+
+
+BENCHMARKS = {
+    "xlsx": bench_xlsx,
+    "pipeline": bench_pipeline,
+    "rules": bench_rules,
+    "keys": bench_keys,
+    "threshold": bench_threshold,
+    "first-metric": bench_first_metric,
+    "memory": bench_memory,
+    "backend": bench_backend,
+    "export": bench_export,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--schemes", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget", type=float, help="memory: allowed peak as a multiple of the source frame (default: by pandas version)")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()